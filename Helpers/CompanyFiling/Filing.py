@@ -1,16 +1,19 @@
-from bs4 import BeautifulSoup
+from . import captions
 from . import fsmetrics
+from . import rpage
+from ..Edgar import cache
+from ..Edgar.concurrency import run_batch
+from ..Edgar.client import make_edgar_request
+from .. import instrumentation
+from lxml import etree
+import functools
+import io
+import logging
 import pandas as pd
-import requests
 import re
+import threading
 
-
-def make_edgar_request(url):
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.131 Safari/537.36"
-    }
-    edgar_request = requests.get(url, headers=headers)
-    return edgar_request
+logger = logging.getLogger(__name__)
 
 
 def convert_filing_to_folder(edgar_filing_url):
@@ -20,32 +23,57 @@ def convert_filing_to_folder(edgar_filing_url):
     return base_url, filing_summary_url
 
 
-def retrieve_face_report_slugs(filing_summary_url):
-    filing_summary_soup = BeautifulSoup(
-        make_edgar_request(filing_summary_url).text, "lxml"
-    )
-    reports = filing_summary_soup.find_all("report")
+# FilingSummary lists the cover and the face statements first, then notes, policies, tables and details.
+STATEMENT_MENU_CATEGORIES = ("", "cover", "document", "statements")
+
+
+def retrieve_face_report_slugs(filing_summary_url, session=None):
+    return face_report_slugs_from_xml(make_edgar_request(filing_summary_url, session=session).content)
+
+
+def resolve_face_report_slugs(base_url, session=None):
+    """
+    Purpose: Face statement slugs of a filing, read from the persisted slug store when the filing has been resolved before, otherwise from its
+    FilingSummary.xml (and then remembered).
+    Inputs: filing folder url, optionally the EdgarSession.
+    Output: dictionary of BS, IS and CF slugs.
+    """
+    slug_store = cache.get_json_store("slugs")
+    slugs = slug_store.get(base_url)
+    if slugs is None:
+        slugs = retrieve_face_report_slugs(base_url + "/FilingSummary.xml", session=session)
+        slug_store.put(base_url, slugs)
+    return slugs
+
+
+def iter_filing_summary_reports(filing_summary_xml):
+    # Streams (short name, html file name, menu category) per <Report>, clearing each element once read.
+    if isinstance(filing_summary_xml, str):
+        filing_summary_xml = filing_summary_xml.encode("utf-8")
+    for _, report in etree.iterparse(io.BytesIO(filing_summary_xml), events=("end",), tag="Report"):
+        yield report.findtext("ShortName") or "", report.findtext("HtmlFileName"), (report.findtext("MenuCategory") or "").lower()
+        report.clear()
+
 
-    tag_for_report_name = "shortname"
-    tag_for_file_name = "htmlfilename"
+def face_report_slugs_from_xml(filing_summary_xml):
+    reports = list()
+    for short_name, file_name, menu_category in iter_filing_summary_reports(filing_summary_xml):
+        # Stop reading once the face statements are over; the remaining reports (often most of the file) are notes and details.
+        if len(reports) >= 4 and menu_category not in STATEMENT_MENU_CATEGORIES:
+            break
+        reports.append((file_name, captions.classify(short_name, kind="report")))
 
     # Income Statement and Balance Sheet are second and fourth reports
-    if re.search(r"balance", reports[2].find(tag_for_report_name).text.lower()):
-        balance_sheet_report_slug = reports[1].find(tag_for_file_name).text
-        income_statement_report_slug = reports[3].find(tag_for_file_name).text
+    if reports[2][1] in ("balance_sheet", "balance_sheet_parenthetical"):
+        balance_sheet_report_slug = reports[1][0]
+        income_statement_report_slug = reports[3][0]
     else:
-        income_statement_report_slug = reports[1].find(tag_for_file_name).text
-        balance_sheet_report_slug = reports[3].find(tag_for_file_name).text
-
-    cash_flow_reports = [
-        report
-        for report in reports
-        if "cash flows" in report.find(tag_for_report_name).text.lower() 
-        and
-        "parenthetical" not in report.find(tag_for_report_name).text.lower()
-    ]
+        income_statement_report_slug = reports[1][0]
+        balance_sheet_report_slug = reports[3][0]
+
+    cash_flow_reports = [file_name for file_name, concept in reports if concept == "cash_flow_statement"]
     assert len(cash_flow_reports) == 1, "Cash Flow ambiguous or not found"
-    cash_flow_report_slug = cash_flow_reports[0].find(tag_for_file_name).text
+    cash_flow_report_slug = cash_flow_reports[0]
 
     slug_dictionary = dict(
         BS=balance_sheet_report_slug,
@@ -56,37 +84,89 @@ def retrieve_face_report_slugs(filing_summary_url):
     return slug_dictionary
 
 
-def extract_dollars(string):
-    if "(" in string:
-        string = re.sub(r"\((.*)\)", r"-\1", string)
-    return string
+# Characters that never carry meaning in an R-page cell: currency symbols, thousands separators and (non-breaking) spaces.
+NUMERIC_CELL_DELETIONS = str.maketrans("", "", "$,\u00a0 ")
+FOOTNOTE_REGEX = re.compile(r"\[\d+\]")
+ZERO_CELLS = ["", "-", "\u2014", "\u2013"]
+MINIMUM_NUMERIC_SHARE = 0.5
+
+
+def coerce_numeric(series):
+    """
+    Purpose: Convert one column of R-page cells to numbers in a single vectorised pass: strips $, commas and footnote markers like [1],
+    reads dashes and blanks as zero, (1,234) as -1234, 12.5% as 0.125 and (5%) or (5)% as -0.05. Columns that are already numeric are
+    returned unchanged.
+    Inputs: pandas Series.
+    Output: (numeric Series, boolean Series marking the cells that could not be parsed).
+    """
+    if series.dtype != "object":
+        return series, pd.Series(False, index=series.index)
+
+    is_missing = series.isna()
+    text = series.astype(str).str.translate(NUMERIC_CELL_DELETIONS).str.replace(FOOTNOTE_REGEX, "", regex=True).str.strip()
+    text = text.mask(is_missing | text.isin(ZERO_CELLS), "0")
+
+    # The percent sign goes first, so that the parentheses of (5%) and (5)% are both at the ends
+    is_percent = is_percent_cell(text)
+    text = text.str.replace("%", "", regex=False).str.strip()
+    is_negative = text.str.startswith("(") & text.str.endswith(")")
+    values = pd.to_numeric(text.str.strip("()"), errors="coerce")
+    values = values.mask(is_negative, -values)
+    if is_percent.any():
+        values = values.mask(is_percent, values / 100)
+
+    return values, values.isna()
+
+
+def is_percent_cell(series):
+    # Percentages are rates, not amounts: coerce_numeric divides them by 100 and clean_report_frame leaves them out of the table multiple
+    return series.astype(str).str.contains("%", regex=False) & series.notna()
+
+
+def coerce_numeric_frame(original_frame):
+    """
+    Purpose: Vectorised numeric cleaning of a statement table. A text column is converted when at least half of its cells parse as numbers;
+    the cells of a converted column that do not parse become NaN and are reported. Columns that are already numeric are skipped, so
+    cleaning an already clean table costs nothing.
+    Inputs: dataframe.
+    Output: (cleaned dataframe, dataframe of unparsed cells with row, column and value).
+    """
+    frame = original_frame.copy()
+    unparsed_cells = list()
+    for col in frame.columns[frame.dtypes == "object"]:
+        values, failed = coerce_numeric(frame[col])
+        if len(frame) and (~failed).mean() >= MINIMUM_NUMERIC_SHARE:
+            unparsed_cells += [dict(row=row, column=col, value=frame.at[row, col]) for row in frame.index[failed]]
+            frame[col] = values
+    return frame, pd.DataFrame(unparsed_cells, columns=["row", "column", "value"])
 
 
 def clean_dataframe(originalFrame):
-    frame = originalFrame.copy()
-    if type(frame) == pd.DataFrame:
-        for col in frame.columns:
-            if frame[col].dtype == "object":
-                try:
-                    frame[col] = clean_dataframe(
-                        frame[col].str.strip().str.replace("-|—", "0", regex=False)
-                    )
-                except:
-                    print(f"Unable to clean column - {col}.")
-        return frame
-
-    elif type(frame) == pd.Series:
-        frame = frame.str.strip().fillna("0")
-        frame[frame == "—"] = "0"
-        frame = frame.apply(lambda x: re.sub(r"\$|,", "", str(x)))
-        frame = frame.apply(extract_dollars)
-
-        return pd.to_numeric(frame)
-
-
-def get_clean_table(table_url):
-    edgar_request = make_edgar_request(table_url)
-    table_df = pd.read_html(edgar_request.content)[0]
+    if type(originalFrame) == pd.Series:
+        return coerce_numeric(originalFrame)[0]
+
+    with instrumentation.timer("clean_dataframe"):
+        frame, unparsed_cells = coerce_numeric_frame(originalFrame)
+    if len(unparsed_cells):
+        instrumentation.count("unparsed_cells", len(unparsed_cells))
+        logger.warning("Unable to parse %d cells: %s", len(unparsed_cells), unparsed_cells.to_dict("records"))
+    return frame
+
+
+def get_clean_table(table_url, session=None):
+    edgar_request = make_edgar_request(table_url, session=session)
+    return clean_table_from_html(edgar_request.content, table_url)
+
+
+def clean_table_from_html(table_html, table_url=None):
+    with instrumentation.timer("read_report", key=table_url):
+        table_df, report_table = rpage.read_report_frame(table_html)
+    return clean_report_frame(table_df, report_table, table_url)
+
+
+def clean_report_frame(table_df, report_table=None, table_url=None):
+    # Second half of clean_table_from_html, for callers that also need the ReportTable (e.g. its period labels)
+    instrumentation.count("table_rows", len(table_df))
 
     if type(table_df.columns) == pd.MultiIndex:
         first_level = table_df.columns.get_level_values(0)
@@ -96,23 +176,27 @@ def get_clean_table(table_url):
     if duplicate_column_names:
         table_df.columns = first_level + "\n" + table_df.columns
 
-    try:
-        if " in " in table_df.columns[0]:
-            table_multiple = re.findall(r"(in [A-Z][a-z]+)", table_df.columns[0])[0].lower()
-        else:
-            table_multiple = "in ones"
-        print(table_multiple)
-        table_multiple_map = {"in ones": 1, "in thousands": 1_000, "in millions": 1_000_000, "in billions": 1_000_000_000}
-        table_multiple = table_multiple_map[table_multiple]
-    except Exception as e:
-        print(f"Error with table multiple: {e}.")
-        print(f"Table url: {table_url}")
+    if report_table is not None:
+        table_multiple = report_table.scale
+    else:
+        try:
+            if " in " in table_df.columns[0]:
+                table_multiple = re.findall(r"(in [A-Z][a-z]+)", table_df.columns[0])[0].lower()
+            else:
+                table_multiple = "in ones"
+            logger.debug("Table multiple %s for %s", table_multiple, table_url)
+            table_multiple_map = {"in ones": 1, "in thousands": 1_000, "in millions": 1_000_000, "in billions": 1_000_000_000}
+            table_multiple = table_multiple_map[table_multiple]
+        except Exception as e:
+            logger.warning("Error with table multiple: %s. Table url: %s", e, table_url)
 
     table_df = table_df.rename(columns={table_df.columns[0]: "Captions"})
     table_df = table_df.dropna(thresh=len(table_df) * 0.1, axis=1)
+    percent_cells = table_df.apply(is_percent_cell)
     table_df = table_df.pipe(clean_dataframe)
 
-    table_df[table_df.select_dtypes("number").columns] = table_df.select_dtypes("number") * table_multiple
+    numeric_columns = table_df.select_dtypes("number").columns
+    table_df[numeric_columns] = table_df[numeric_columns].where(percent_cells[numeric_columns], table_df[numeric_columns] * table_multiple)
 
     return table_df
 
@@ -141,47 +225,255 @@ def common_size_financial_statement(original_dataframe=pd.DataFrame, divisor=Non
     return dataframe
 
 
-def parse_dei_table(base_url):
-    request = make_edgar_request(base_url + "/R1.htm")
-    doc_and_entity_df = pd.read_html(request.content)[0]
+def parse_dei_table(base_url, session=None):
+    request = make_edgar_request(base_url + "/R1.htm", session=session)
+    return dei_table_from_html(request.content)
+
+
+def dei_table_from_html(dei_html):
+    doc_and_entity_df, _ = rpage.read_report_frame(dei_html)
     doc_and_entity_df.columns = doc_and_entity_df.columns.droplevel(0)
     label_column = doc_and_entity_df.columns[0]
     doc_and_entity_df = doc_and_entity_df.set_index(label_column)
     return doc_and_entity_df
 
 
+def prepare_balance_sheet(bs):
+    return bs.pipe(remove_rows_of_zeros)
+
+
+def prepare_income_statement(is_df):
+    is_df = is_df.query("~Captions.fillna('').str.contains('\[')") 
+    is_df = is_df.query("Captions.notnull()")
+    is_df = is_df.dropna(thresh=len(is_df)*.1, axis=1)
+    is_df = is_df.pipe(clean_dataframe)
+    is_df = is_df.pipe(remove_rows_of_zeros)
+    is_df = is_df.drop_duplicates(subset=["Captions"], keep="first")
+    return is_df
+
+
+def prepare_cash_flow(cf):
+    return cf.pipe(remove_rows_of_zeros)
+
+
+def fetch_filing_pages(edgar_filing_url, session=None, page_pool=None):
+    """
+    Purpose: Download everything a Filing needs: FilingSummary.xml (unless the slugs are already known) and R1.htm together, then the three
+    face statements together.
+    Inputs: Edgar Filing URL, optionally the EdgarSession and a thread pool to fetch pages concurrently on.
+    Output: dictionary of the resolved slugs and the raw page contents.
+    """
+    with instrumentation.timer("fetch_filing", key=edgar_filing_url):
+        return fetch_pages(edgar_filing_url, session, page_pool)
+
+
+def fetch_pages(edgar_filing_url, session=None, page_pool=None):
+    base_url, filing_summary_url = convert_filing_to_folder(edgar_filing_url)
+    fetch = functools.partial(checked_request, session=session)
+    slug_store = cache.get_json_store("slugs")
+    slugs = slug_store.get(base_url)
+
+    if page_pool is None:
+        dei = fetch(base_url + "/R1.htm")
+        if slugs is None:
+            slugs = face_report_slugs_from_xml(fetch(filing_summary_url).content)
+        statements = {kind: fetch(base_url + "/" + slug) for kind, slug in slugs.items()}
+    else:
+        dei_future = page_pool.submit(fetch, base_url + "/R1.htm")
+        if slugs is None:
+            slugs = face_report_slugs_from_xml(page_pool.submit(fetch, filing_summary_url).result().content)
+        statement_futures = {kind: page_pool.submit(fetch, base_url + "/" + slug) for kind, slug in slugs.items()}
+        statements = {kind: future.result() for kind, future in statement_futures.items()}
+        dei = dei_future.result()
+    slug_store.put(base_url, slugs)
+
+    pages = {kind: response.content for kind, response in statements.items()}
+    pages["DEI"] = dei.content
+    return dict(url=edgar_filing_url, slugs=slugs, pages=pages)
+
+
+def checked_request(url, session=None):
+    edgar_request = make_edgar_request(url, session=session)
+    edgar_request.raise_for_status()
+    return edgar_request
+
+
+def parse_filing_pages(fetched_filing):
+    """
+    Purpose: Turn the raw pages from fetch_filing_pages into the cleaned statements a Filing caches. Runs in a worker process during Filing.batch.
+    Inputs: dictionary returned by fetch_filing_pages.
+    Output: dictionary of slugs and the bs, is_, cf and dei tables.
+    """
+    pages = fetched_filing["pages"]
+    with instrumentation.timer("parse_filing", key=fetched_filing["url"]):
+        return dict(
+            slugs=fetched_filing["slugs"],
+            bs=prepare_balance_sheet(clean_table_from_html(pages["BS"], fetched_filing["url"])),
+            is_=prepare_income_statement(clean_table_from_html(pages["IS"], fetched_filing["url"])),
+            cf=prepare_cash_flow(clean_table_from_html(pages["CF"], fetched_filing["url"])),
+            dei=dei_table_from_html(pages["DEI"]),
+        )
+
+
+STATEMENT_PREPARERS = dict(BS=prepare_balance_sheet, IS=prepare_income_statement, CF=prepare_cash_flow)
+
+
+def load_statement(statement_url, kind, session=None):
+    if kind == "DEI":
+        return dei_table_from_html(make_edgar_request(statement_url, session=session).content)
+    return STATEMENT_PREPARERS[kind](get_clean_table(statement_url, session=session))
+
+
+class StatementCache:
+
+    """
+    Statement Cache Class\n
+    Parsed statement tables keyed by page URL. Each page is fetched and parsed at most once, even when several threads ask for it at
+    the same time, until it is invalidated.
+
+    Use:\n
+    cache = StatementCache()
+    bs = cache.get(balance_sheet_url, functools.partial(load_statement, kind="BS"))
+    cache.invalidate(balance_sheet_url)
+    """
+
+    def __init__(self):
+        self.tables = dict()
+        self._lock = threading.Lock()
+        self._url_locks = dict()
+
+
+    def __contains__(self, url):
+        return url in self.tables
+
+
+    def __len__(self):
+        return len(self.tables)
+
+
+    def __getstate__(self):
+        return dict(tables=self.tables)
+
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.tables = state["tables"]
+
+
+    def get(self, url, load):
+        with self._lock:
+            if url in self.tables:
+                return self.tables[url]
+            url_lock = self._url_locks.setdefault(url, threading.Lock())
+        with url_lock:
+            if url not in self.tables:
+                table = load(url)
+                with self._lock:
+                    self.tables[url] = table
+            return self.tables[url]
+
+
+    def put(self, url, table):
+        with self._lock:
+            self.tables[url] = table
+
+
+    def invalidate(self, url=None):
+        with self._lock:
+            if url is None:
+                self.tables.clear()
+            else:
+                self.tables.pop(url, None)
+
 
 class Filing:
 
-    def __init__(self, edgar_filing_url):
+    def __init__(self, edgar_filing_url, session=None, slugs=None):
+        self.session = session
+        self.statements = StatementCache()
+        self.edgar_filing_url = edgar_filing_url
         self.base_url, self.filing_summary_url = convert_filing_to_folder(edgar_filing_url=edgar_filing_url)
-        self.get_slugs()
+        # Nothing is fetched here: slugs are resolved the first time a face statement is needed.
+        self._slugs = slugs
         self.ticker = edgar_filing_url.split("/")[-1].split("-")[0]
         self.period_end = edgar_filing_url.split("/")[-1].split("-")[1].replace(".htm", "")
 
 
-    def get_slugs(self):
-        self.slugs = retrieve_face_report_slugs(self.filing_summary_url)
-        self.balance_sheet_url = self.base_url + "/" + self.slugs["BS"]
-        self.income_statement_url = self.base_url + "/" + self.slugs["IS"]
-        self.cash_flow_url = self.base_url + "/" + self.slugs["CF"]
+    @classmethod
+    def batch(cls, edgar_filing_urls, session=None, max_workers=10, parse_workers=None):
+        """
+        Purpose: Load many filings at once. Pages are fetched on a thread pool through one shared, rate-limited session and the tables are
+        parsed on a process pool, so network wait and parsing overlap.
+        Inputs: Edgar Filing URLs, optionally an EdgarSession, the number of fetch threads and parse processes (0 parses on the fetch threads).
+        Output: generator of BatchResult(url, result, error) in completion order; result is a Filing with bs, is_, cf and dei already loaded,
+        error is the exception that stopped that filing (the rest of the batch carries on).
+        """
+        for batch_result in run_batch(edgar_filing_urls, fetch_filing_pages, parse_filing_pages, session, max_workers, parse_workers):
+            if batch_result.error is not None:
+                yield batch_result
+                continue
+            parsed = batch_result.result
+            filing = cls(batch_result.url, session=session, slugs=parsed["slugs"])
+            filing.bs, filing.is_, filing.cf, filing.dei = parsed["bs"], parsed["is_"], parsed["cf"], parsed["dei"]
+            yield batch_result._replace(result=filing)
+
+
+    def get_slugs(self, slugs=None):
+        self._slugs = slugs if slugs is not None else resolve_face_report_slugs(self.base_url, session=self.session)
+        return self._slugs
+
+
+    @property
+    def slugs(self):
+        if self._slugs is None:
+            self.get_slugs()
+        return self._slugs
+
+
+    balance_sheet_url = property(lambda self: self.statement_url("BS"))
+    income_statement_url = property(lambda self: self.statement_url("IS"))
+    cash_flow_url = property(lambda self: self.statement_url("CF"))
+
+
+    def statement_url(self, kind):
+        return self.base_url + "/R1.htm" if kind == "DEI" else self.base_url + "/" + self.slugs[kind]
+
+
+    def statement(self, kind):
+        """
+        Purpose: Memoised access to one of the filing's tables, so every metric computed on the filing shares one fetch and parse per page.
+        Inputs: "BS", "IS", "CF" or "DEI".
+        Output: the cleaned table (prepared the same way as get_balance_sheet / get_income_statement / get_cash_flow).
+        """
+        return self.statements.get(self.statement_url(kind), functools.partial(load_statement, kind=kind, session=self.session))
+
+
+    def invalidate(self, kind=None):
+        if kind is None:
+            self.statements.invalidate()
+        else:
+            self.statements.invalidate(self.statement_url(kind))
+
+
+    bs = property(lambda self: self.statement("BS"), lambda self, table: self.statements.put(self.statement_url("BS"), table))
+    is_ = property(lambda self: self.statement("IS"), lambda self, table: self.statements.put(self.statement_url("IS"), table))
+    cf = property(lambda self: self.statement("CF"), lambda self, table: self.statements.put(self.statement_url("CF"), table))
+    dei = property(lambda self: self.statement("DEI"), lambda self, table: self.statements.put(self.statement_url("DEI"), table))
 
 
     def get_oustanding_shares(self):
-        shares_as_of_date, shares_outstanding = fsmetrics.get_shares_outstanding(self.base_url)
+        shares_as_of_date, shares_outstanding = fsmetrics.shares_outstanding_from_dei_table(self.dei)
         return shares_as_of_date, shares_outstanding
 
 
     def get_balance_sheet(self, commonsize=False):
-        if hasattr(self, "bs"):
-            bs = self.bs
-        else:
-            bs = get_clean_table(self.balance_sheet_url)
-            bs = bs.pipe(remove_rows_of_zeros)
-            self.bs = bs
-        
+        bs = self.bs
+
         if commonsize:
-            divisor_caption = [caption for caption in bs["Captions"] if re.search(r"total", caption.lower()) and re.search(r"equity", caption.lower())][0]
+            # The strict total equity caption when there is one, any other "total ... equity" caption otherwise
+            concepts = captions.classify_many(bs["Captions"])
+            equity_captions = bs["Captions"][concepts == "total_equity"]
+            divisor_caption = (equity_captions if len(equity_captions) else bs["Captions"][concepts == "total_equity_loose"]).iloc[0]
             bs = common_size_financial_statement(bs, divisor=bs.query("Captions == @divisor_caption").select_dtypes("number").iloc[0])
                 
             styled_bs = bs.style\
@@ -199,18 +491,8 @@ class Filing:
 
 
     def get_income_statement(self, commonsize=False):
-        if hasattr(self, "is_"):
-            is_df = self.is_
-        else:
-            is_df = get_clean_table(self.income_statement_url)
-            is_df = is_df.query("~Captions.fillna('').str.contains('\[')") 
-            is_df = is_df.query("Captions.notnull()")
-            is_df = is_df.dropna(thresh=len(is_df)*.1, axis=1)
-            is_df = is_df.pipe(clean_dataframe)
-            is_df = is_df.pipe(remove_rows_of_zeros)
-            is_df = is_df.drop_duplicates(subset=["Captions"], keep="first")
-            self.is_ = is_df
-        
+        is_df = self.is_
+
         if commonsize:
             is_df = common_size_financial_statement(is_df, divisor=is_df.select_dtypes("number").iloc[0])
                 
@@ -230,12 +512,7 @@ class Filing:
 
 
     def get_cash_flow(self, commonsize=False):
-        if hasattr(self, "cf"):
-            cf = self.cf
-        else:
-            cf = get_clean_table(self.cash_flow_url)
-            cf = cf.pipe(remove_rows_of_zeros)
-            self.cf = cf
+        cf = self.cf
 
         if commonsize:
             cf = common_size_financial_statement(cf, divisor=cf.select_dtypes("number").iloc[0])
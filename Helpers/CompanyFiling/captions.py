@@ -0,0 +1,118 @@
+from ..Edgar import cache
+import pandas as pd
+import re
+import threading
+
+
+# Bump whenever the patterns change, so classifications persisted by an older version are discarded.
+CLASSIFIER_VERSION = 2
+
+# Checked in order on the normalised caption; the first match wins. "total_equity_loose" is any other total mentioning equity
+# ("Total temporary equity", "Total equity method investments"), only meant as a last resort when no caption is "total_equity".
+CAPTION_PATTERNS = dict(
+    line_item=[
+        ("total_equity", re.compile(r"^(?:total\b\s*[stockholders\W*]*[shareholders\W*]*)?equity\s*[\(\w+\)]*$")),
+        ("total_liabilities_and_equity", re.compile(r"^total liabilities\b.*equity")),
+        ("total_equity_loose", re.compile(r"(?=.*total)(?=.*equity)")),
+        ("operating_activity", re.compile(r"(?=.*net cash)(?=.*operating activities)")),
+        ("overall_cash_flow", re.compile(r"(?=.*(?:increase|decrease))(?=.*cash)")),
+    ],
+    report=[
+        ("cash_flow_parenthetical", re.compile(r"(?=.*cash flows)(?=.*parenthetical)")),
+        ("cash_flow_statement", re.compile(r"cash flows")),
+        ("balance_sheet_parenthetical", re.compile(r"(?=.*balance)(?=.*parenthetical)")),
+        ("balance_sheet", re.compile(r"balance")),
+    ],
+)
+
+APOSTROPHES = str.maketrans({"\u2019": "'", "\u2018": "'", "\u00a0": " "})
+FOOTNOTE_REGEX = re.compile(r"\s*\[\d+\]")
+WHITESPACE_REGEX = re.compile(r"\s+")
+
+
+def normalise_caption(caption):
+    # Captions differ between issuers only by case, curly apostrophes, footnote markers and spacing.
+    if not isinstance(caption, str):
+        return ""
+    caption = FOOTNOTE_REGEX.sub("", caption.translate(APOSTROPHES))
+    return WHITESPACE_REGEX.sub(" ", caption).strip().lower()
+
+
+class CaptionClassifier:
+
+    """
+    Caption Classifier Class\n
+    Maps R-page line item captions and FilingSummary report names to canonical concepts ("total_equity", "operating_activity",
+    "balance_sheet", ...) with precompiled patterns. Classifications are memoised by normalised caption in a JsonStore, so with a
+    persistent store each distinct caption is only classified once across runs.
+
+    Use:\n
+    classifier = CaptionClassifier(cache.JsonStore("captions.json", CLASSIFIER_VERSION))
+    classifier.classify("Total stockholders' equity")                   # "total_equity"
+    classifier.classify("CONDENSED CONSOLIDATED BALANCE SHEETS", "report")  # "balance_sheet"
+    classifier.store.save()
+    """
+
+    def __init__(self, store=None, patterns=CAPTION_PATTERNS):
+        self.store = store if store is not None else cache.JsonStore(version=CLASSIFIER_VERSION)
+        self.patterns = patterns
+
+
+    def classify(self, caption, kind="line_item"):
+        """
+        Purpose: Canonical concept of one caption.
+        Inputs: caption text and its kind, "line_item" (R-page row caption) or "report" (FilingSummary short name).
+        Output: concept name, or None when no pattern matches.
+        """
+        normalised = normalise_caption(caption)
+        key = kind + ":" + normalised
+        if key in self.store:
+            return self.store.get(key)
+        concept = next((concept for concept, pattern in self.patterns[kind] if pattern.search(normalised)), None)
+        self.store.put(key, concept)
+        return concept
+
+
+    def classify_many(self, captions, kind="line_item"):
+        """
+        Purpose: Classify a column of captions, running classify once per distinct caption.
+        Inputs: iterable of captions and their kind.
+        Output: Series of concepts (None where no pattern matches) aligned with the captions.
+        """
+        captions = pd.Series(captions)
+        codes, uniques = pd.factorize(captions)
+        concepts = pd.Series([self.classify(caption, kind) for caption in uniques] + [None], dtype=object)
+        return pd.Series(concepts.to_numpy()[codes], index=captions.index, dtype=object)
+
+
+_default_classifier = None
+_default_classifier_lock = threading.Lock()
+
+
+def get_default_classifier():
+    """
+    Purpose: Return the process-wide classifier. Its classifications persist in captions.json next to the default EDGAR response cache.
+    Inputs: None.
+    Output: CaptionClassifier.
+    """
+    global _default_classifier
+    with _default_classifier_lock:
+        if _default_classifier is None:
+            _default_classifier = CaptionClassifier(cache.get_json_store("captions", CLASSIFIER_VERSION))
+        return _default_classifier
+
+
+def set_default_classifier(classifier):
+    # None goes back to the default classifier on next use; returns the previous one.
+    global _default_classifier
+    with _default_classifier_lock:
+        previous, _default_classifier = _default_classifier, classifier
+    return previous
+
+
+def classify(caption, kind="line_item"):
+    return get_default_classifier().classify(caption, kind)
+
+
+def classify_many(captions, kind="line_item"):
+    return get_default_classifier().classify_many(captions, kind)
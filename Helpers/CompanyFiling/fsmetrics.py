@@ -1,11 +1,29 @@
+import numpy as np
 import pandas as pd
 from . import Filing
+from . import captions
+from .. import instrumentation
 import re
 
 
-def get_shares_outstanding(base_url):
-    dei_table = Filing.parse_dei_table(base_url)
+PANEL_KEYS = ["ticker", "period_end"]
 
+
+def statement_table(source, kind, session=None):
+    # A Filing hands out its memoised table; a page URL is fetched and parsed every time.
+    if isinstance(source, Filing.Filing):
+        return source.statement(kind)
+    return Filing.load_statement(source, kind, session=session)
+
+
+def get_shares_outstanding(base_url, session=None):
+    if isinstance(base_url, Filing.Filing):
+        return base_url.get_oustanding_shares()
+    dei_table = Filing.parse_dei_table(base_url, session=session)
+    return shares_outstanding_from_dei_table(dei_table)
+
+
+def shares_outstanding_from_dei_table(dei_table):
     share_multiplier_in_name = re.search(r"(shares in \w+)", dei_table.index.name)
     table_multiple_map = {"in ones": 1, "in thousands": 1_000, "in millions": 1_000_000, "in billions": 1_000_000_000}
 
@@ -26,12 +44,12 @@ def get_shares_outstanding(base_url):
     return shares_as_of_date, shares_outstanding
 
 
-def book_value_per_share(balance_sheet_url, shares_outstanding):
-    bs = Filing.get_clean_table(balance_sheet_url)
-    bs = bs.pipe(Filing.remove_rows_of_zeros)
+@instrumentation.timer("per_share_metrics")
+def book_value_per_share(balance_sheet_url, shares_outstanding, session=None):
+    # balance_sheet_url can also be a Filing, which reuses the balance sheet it already parsed
+    bs = statement_table(balance_sheet_url, "BS", session=session)
 
-    total_equity_regex = r"([Total]*\s*[stockholders\W*]*[shareholders\W*]*[eE]quity)\s*[\(\w+\)]*$"
-    equity_line_item = bs[bs["Captions"].str.match(total_equity_regex)]
+    equity_line_item = bs[captions.classify_many(bs["Captions"]) == "total_equity"]
     if len(equity_line_item) > 1:
         total_equity = equity_line_item.iloc[0].values[1]
     else:
@@ -40,11 +58,13 @@ def book_value_per_share(balance_sheet_url, shares_outstanding):
     return total_equity / shares_outstanding
 
 
-def cash_flow_per_share(cash_flow_url, shares_outstanding, per_share=True):
-    cf = Filing.get_clean_table(cash_flow_url)
-    cf = cf.pipe(Filing.remove_rows_of_zeros)
+@instrumentation.timer("per_share_metrics")
+def cash_flow_per_share(cash_flow_url, shares_outstanding, per_share=True, session=None):
+    # cash_flow_url can also be a Filing, which reuses the cash flow statement it already parsed
+    cf = statement_table(cash_flow_url, "CF", session=session)
 
-    operating_activity_caption = [ caption for caption in cf["Captions"] if "operating activities" in caption.lower() and "net cash" in caption.lower()]
+    caption_concepts = captions.classify_many(cf["Captions"])
+    operating_activity_caption = list(cf["Captions"][caption_concepts == "operating_activity"])
     assert len(operating_activity_caption) == 1, "Number of operating activity captions should be only one for net operating activity"
     operating_activity_values = cf.set_index("Captions").loc[operating_activity_caption].squeeze().values
 
@@ -57,7 +77,7 @@ def cash_flow_per_share(cash_flow_url, shares_outstanding, per_share=True):
         else:
             operating_activity_value = [value for value in operating_activity_values if value != 0][0]
 
-    overall_cash_flow_caption = [ caption for caption in cf["Captions"] if re.search(r"increase|decrease", caption.lower()) and "cash" in caption.lower()]
+    overall_cash_flow_caption = list(cf["Captions"][caption_concepts == "overall_cash_flow"])
     overall_cash_flow_values = cf.set_index("Captions").loc[overall_cash_flow_caption].squeeze().values
 
     if overall_cash_flow_values[0] != 0:
@@ -75,3 +95,114 @@ def cash_flow_per_share(cash_flow_url, shares_outstanding, per_share=True):
         return overall_operating_activity_per_share, overall_cash_flow_per_share
     else:
         return operating_activity_value, overall_cash_flow_value
+
+
+def stack_statements(statements):
+    """
+    Purpose: Stack many cleaned statements into one long frame, one row per (filing, line item, numeric column).
+    Inputs: dictionary of (ticker, period_end) to a cleaned statement table (e.g. Filing.bs or Filing.cf).
+    Output: dataframe with ticker, period_end, row (line item position), Captions, column (numeric column position) and value.
+    """
+    stacked = list()
+    for (ticker, period_end), table in statements.items():
+        numeric = table.select_dtypes("number").to_numpy(dtype=float)
+        rows, columns = np.indices(numeric.shape)
+        stacked.append(pd.DataFrame(dict(
+            ticker=ticker,
+            period_end=period_end,
+            row=rows.ravel(),
+            Captions=np.repeat(table["Captions"].to_numpy(), numeric.shape[1]),
+            column=columns.ravel(),
+            value=numeric.ravel(),
+        )))
+    if not stacked:
+        return pd.DataFrame(columns=PANEL_KEYS + ["row", "Captions", "column", "value"])
+    return pd.concat(stacked, ignore_index=True)
+
+
+def classify_stacked_captions(stacked):
+    # Each distinct caption is classified once (and remembered across runs), then broadcast back to the long frame.
+    concepts = captions.classify_many(stacked["Captions"]).to_numpy()
+    return pd.DataFrame({concept: concepts == concept for concept in ["total_equity", "operating_activity", "overall_cash_flow"]}, index=stacked.index)
+
+
+def first_line_item_matrix(stacked, is_line_item):
+    # Values of each filing's first matching line item, one row per filing that has one and one column per numeric column position.
+    line_items = stacked[is_line_item]
+    line_items = line_items[line_items["row"] == line_items.groupby(PANEL_KEYS)["row"].transform("min")]
+    return line_items.set_index(PANEL_KEYS + ["column"])["value"].unstack("column")
+
+
+def first_non_zero_values(matrix, column_counts):
+    """
+    Purpose: Vectorised form of the column choice in cash_flow_per_share: the first column unless it is zero, the second column when the
+    statement has exactly three columns (previous QTD values reported alongside), otherwise the first non-zero column.
+    Inputs: first_line_item_matrix output and the number of numeric columns of each filing's statement.
+    Output: Series of the chosen value per filing.
+    """
+    values = matrix.reindex(columns=range(max(matrix.shape[1], 2))).to_numpy()
+    column_counts = column_counts.reindex(matrix.index).to_numpy()
+    exists = np.arange(values.shape[1]) < column_counts[:, None]
+    # NaN compares as non-zero, as it does in the scalar version
+    non_zero = exists & (values != 0)
+    first_non_zero = np.where(non_zero.any(axis=1), values[np.arange(len(values)), non_zero.argmax(axis=1)], np.nan)
+    chosen = np.where(values[:, 0] != 0, values[:, 0], np.where(column_counts == 3, values[:, 1], first_non_zero))
+    return pd.Series(chosen, index=matrix.index)
+
+
+@instrumentation.timer("panel_metrics")
+def panel_per_share_metrics(stacked_bs, stacked_cf, shares_outstanding):
+    """
+    Purpose: book_value_per_share and cash_flow_per_share for many filings at once. Captions are classified once per distinct caption and
+    the column rules are applied as array operations over all filings.
+    Inputs: stack_statements output for the balance sheets and the cash flow statements, and a Series of shares outstanding indexed by
+    (ticker, period_end).
+    Output: dataframe indexed by (ticker, period_end) with shares outstanding, total equity, book value per share, operating activity,
+    overall cash flow and both per share. Filings without exactly one net operating activity caption get NaN cash flow values, and
+    filings without a total equity caption NaN book values, where the scalar functions would raise.
+    """
+    bs_classes = classify_stacked_captions(stacked_bs)
+    # Filings without a total equity caption get NaN, like the cash flow values
+    total_equity = first_line_item_matrix(stacked_bs, bs_classes["total_equity"].to_numpy()).reindex(columns=[0])[0]
+
+    cf_classes = classify_stacked_captions(stacked_cf)
+    column_counts = stacked_cf.groupby(PANEL_KEYS)["column"].max() + 1
+    operating_matrix = first_line_item_matrix(stacked_cf, cf_classes["operating_activity"].to_numpy())
+    operating_activity = first_non_zero_values(operating_matrix, column_counts)
+    operating_captions = stacked_cf[cf_classes["operating_activity"].to_numpy()].groupby(PANEL_KEYS)["Captions"].nunique()
+    operating_activity = operating_activity.where(operating_captions.reindex(operating_activity.index) == 1)
+    overall_cash_flow = first_non_zero_values(first_line_item_matrix(stacked_cf, cf_classes["overall_cash_flow"].to_numpy()), column_counts)
+
+    if not len(shares_outstanding):
+        shares_outstanding = pd.Series(index=pd.MultiIndex.from_tuples([], names=PANEL_KEYS), dtype=float)
+    # One row per filing supplied, whatever line items the statements have
+    filings = shares_outstanding.index
+    metrics = pd.DataFrame(dict(
+        shares_outstanding=shares_outstanding,
+        total_equity=total_equity.reindex(filings),
+        operating_activity=operating_activity.reindex(filings),
+        overall_cash_flow=overall_cash_flow.reindex(filings),
+    ))
+    metrics.index.names = PANEL_KEYS
+    metrics["book_value_per_share"] = metrics["total_equity"] / metrics["shares_outstanding"]
+    metrics["operating_activity_per_share"] = metrics["operating_activity"] / metrics["shares_outstanding"]
+    metrics["overall_cash_flow_per_share"] = metrics["overall_cash_flow"] / metrics["shares_outstanding"]
+    return metrics.sort_index()
+
+
+def filings_per_share_metrics(filings):
+    """
+    Purpose: Screen many filings: stacks their memoised statements and runs panel_per_share_metrics.
+    Inputs: iterable of Filing objects (e.g. the results of Filing.batch), at most one per ticker and period end: drop amendments or
+    originals first, as rows are keyed by (ticker, period_end).
+    Output: dataframe indexed by (ticker, period_end), see panel_per_share_metrics.
+    """
+    filings = list(filings)
+    keys = pd.Series([(filing.ticker, filing.period_end) for filing in filings], dtype=object)
+    if keys.duplicated().any():
+        raise ValueError(f"More than one filing for {', '.join(map(str, keys[keys.duplicated()].unique()))}; keep one filing per ticker and period end")
+    filings = {(filing.ticker, filing.period_end): filing for filing in filings}
+    shares_outstanding = pd.Series({key: filing.get_oustanding_shares()[1] for key, filing in filings.items()}, dtype=float)
+    stacked_bs = stack_statements({key: filing.bs for key, filing in filings.items()})
+    stacked_cf = stack_statements({key: filing.cf for key, filing in filings.items()})
+    return panel_per_share_metrics(stacked_bs, stacked_cf, shares_outstanding)
@@ -0,0 +1,189 @@
+from . import Filing
+from . import captions
+from . import rpage
+from ..Edgar import cache
+from ..Edgar import submissions
+from ..Edgar.concurrency import run_batch
+from .. import instrumentation
+import logging
+import os
+import pandas as pd
+import re
+
+logger = logging.getLogger(__name__)
+
+HISTORY_VERSION = 1
+STATEMENT_KINDS = ["BS", "IS", "CF"]
+HISTORY_COLUMNS = ["url", "filing_date", "statement", "line", "Captions", "period", "duration", "period_end", "value"]
+PERIOD_REGEX = re.compile(r"^(?:(?P<duration>\d+ (?:Months?|Weeks?)) Ended )?(?P<month>[A-Z][a-z]{2})[a-z]*\.? (?P<day>\d{1,2}), (?P<year>\d{4})$")
+
+
+def parse_period(period):
+    """
+    Purpose: Read the duration and end date of an R page column, e.g. "3 Months Ended Jun. 30, 2021" or "Dec. 31, 2020" (an instant).
+    Inputs: period label (see rpage.ReportTable.periods).
+    Output: (duration, period end): duration is "" for instants; (None, NaT) when the label is not a period.
+    """
+    match = PERIOD_REGEX.match(" ".join(period.split()))
+    if match is None:
+        return None, pd.NaT
+    period_end = pd.to_datetime(f"{match['month']} {match['day']} {match['year']}", format="%b %d %Y", errors="coerce")
+    return match["duration"] or "", period_end
+
+
+def column_periods(table, report_table):
+    # Cleaned tables drop the duration header when it is not needed to tell columns apart ("Jun. 30, 2021" in a cash flow statement),
+    # so the full period label is looked up among the page's header labels.
+    periods = report_table.periods if report_table is not None else list()
+    column_labels = dict()
+    for column in table.select_dtypes("number").columns:
+        label = " ".join(str(column).split())
+        column_labels[column] = next((period for period in periods if period == label or period.endswith(" " + label)), label)
+    return column_labels
+
+
+def parse_history_pages(fetched_filing):
+    """
+    Purpose: Turn the raw pages of one filing (Filing.fetch_filing_pages) into history rows. Runs in a worker process during IssuerHistory.update.
+    Inputs: dictionary returned by Filing.fetch_filing_pages.
+    Output: dataframe of HISTORY_COLUMNS, one row per line item and period column of the BS, IS and CF.
+    """
+    long_frames = list()
+    for kind in STATEMENT_KINDS:
+        # Each page is parsed once; the ReportTable is kept for its full period labels.
+        with instrumentation.timer("read_report", key=fetched_filing["url"]):
+            table_df, report_table = rpage.read_report_frame(fetched_filing["pages"][kind])
+        table = Filing.STATEMENT_PREPARERS[kind](Filing.clean_report_frame(table_df, report_table, fetched_filing["url"]))
+        column_labels = column_periods(table, report_table)
+        long_frame = table[list(column_labels)].assign(Captions=table["Captions"].to_numpy(), line=range(len(table)))
+        long_frame = long_frame.melt(id_vars=["line", "Captions"], value_vars=list(column_labels), var_name="period", value_name="value")
+        long_frame["period"] = long_frame["period"].map(column_labels)
+        long_frames.append(long_frame.assign(statement=kind))
+
+    history_df = pd.concat(long_frames, ignore_index=True)
+    parsed_periods = {period: parse_period(period) for period in history_df["period"].unique()}
+    history_df["duration"] = history_df["period"].map(lambda period: parsed_periods[period][0])
+    history_df["period_end"] = pd.to_datetime(history_df["period"].map(lambda period: parsed_periods[period][1]))
+    history_df["url"] = fetched_filing["url"]
+    history_df["filing_date"] = pd.NaT
+    return history_df[HISTORY_COLUMNS]
+
+
+def period_order(column):
+    # Newest period end first, shorter durations first within one period end
+    period_end, duration = column
+    return -period_end.value, int(duration.split()[0]) if duration else 0
+
+
+def period_label(duration, period_end):
+    date = f"{period_end:%b}. {period_end.day}, {period_end.year}"
+    return f"{duration} Ended {date}" if duration else date
+
+
+class IssuerHistory:
+
+    """
+    Issuer History Class\n
+    Aligned multi-period BS, IS and CF for one issuer, assembled from all of its periodic filings. Filings are fetched and parsed in
+    parallel and every parsed filing is kept (in the default cache directory, unless caching is disabled), so update() after a new
+    filing only fetches that filing; the periods it shares with older filings come from the stored rows. When several filings report
+    the same line item and period (comparative columns, restatements), the latest filing wins. Line items are matched across filings
+    by their normalised caption, so small wording changes (curly apostrophes, footnote marks, capitalisation) do not split a row.
+
+    Use:\n
+    history = IssuerHistory(1512673, filing_index=submissions.load_filing_index("CIK0001512673.json"))
+    errors = history.update()
+    history.statement("IS", duration="3 Months")
+
+    filing_index can also be left out to read the submissions api, or be a dataframe like submissions.filing_index.
+    """
+
+    def __init__(self, cik, filing_index=None, forms=submissions.PERIODIC_FORMS, session=None, directory=None):
+        self.cik = int(cik)
+        self.forms = forms
+        self.session = session
+        self._filing_index = submissions.load_filing_index(filing_index, self.cik) if isinstance(filing_index, str) else filing_index
+        if directory is None and cache.get_default_cache() is not None:
+            directory = os.path.join(cache.get_default_cache().directory, "history")
+        self.path = os.path.join(directory, f"CIK{self.cik:010d}.v{HISTORY_VERSION}.parquet") if directory is not None else None
+        self.history_df = pd.read_parquet(self.path) if self.path is not None and os.path.exists(self.path) else pd.DataFrame(columns=HISTORY_COLUMNS)
+
+
+    @property
+    def filing_index(self):
+        if self._filing_index is None:
+            self._filing_index = submissions.filing_index(self.cik, session=self.session, complete=True)
+        return self._filing_index
+
+
+    def filings(self):
+        # Periodic filings of the issuer, newest first
+        index_df = self.filing_index
+        return index_df[index_df["form"].isin(self.forms)].sort_values(["filing_date", "accession"], ascending=False, ignore_index=True)
+
+
+    def update(self, max_workers=10, parse_workers=None):
+        """
+        Purpose: Fetch and parse the periodic filings that are not in the history yet, then store the history.
+        Inputs: optionally the number of fetch threads and parse processes (0 parses on the fetch threads).
+        Output: dictionary of filing url to the exception that stopped it; failed filings are tried again on the next update.
+        """
+        filings_df = self.filings()
+        known_urls = set(self.history_df["url"])
+        pending_urls = [url for url in filings_df["url"] if url not in known_urls]
+        filing_dates = dict(zip(filings_df["url"], pd.to_datetime(filings_df["filing_date"])))
+
+        errors, history_frames = dict(), list()
+        for batch_result in run_batch(pending_urls, Filing.fetch_filing_pages, parse_history_pages, self.session, max_workers, parse_workers):
+            if batch_result.error is not None:
+                logger.warning("Failed: %s - %r", batch_result.url, batch_result.error)
+                errors[batch_result.url] = batch_result.error
+                continue
+            history_frames.append(batch_result.result.assign(filing_date=filing_dates[batch_result.url]))
+
+        if history_frames:
+            frames = [self.history_df] if len(self.history_df) else list()
+            self.history_df = pd.concat(frames + history_frames, ignore_index=True)
+            self.save()
+        return errors
+
+
+    def save(self):
+        if self.path is None:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temporary_path = self.path + ".tmp"
+        self.history_df.to_parquet(temporary_path, index=False)
+        os.replace(temporary_path, self.path)
+
+
+    def statement(self, kind, duration=None):
+        """
+        Purpose: Assemble one statement across all filings in the history.
+        Inputs: "BS", "IS" or "CF", optionally a duration to keep, e.g. "3 Months" or "12 Months" ("" for the balance sheet's instants).
+        Output: dataframe with the Captions column and one column per period (e.g. "6 Months Ended Jun. 30, 2021"), newest first. Rows
+        follow the latest filing, with line items that only older filings report after them.
+        """
+        rows = self.history_df[(self.history_df["statement"] == kind) & self.history_df["period_end"].notna()]
+        if duration is not None:
+            rows = rows[rows["duration"] == duration]
+        if rows.empty:
+            return pd.DataFrame(columns=["Captions"])
+
+        # Line items are keyed by normalised caption and their occurrence within the filing, so a repeated caption ("Other") keeps its rows apart.
+        # Blank captions get their own code (and the key ""), rather than -1, which would index the last caption.
+        caption_codes, unique_captions = pd.factorize(rows["Captions"], use_na_sentinel=False)
+        rows = rows.assign(caption_key=pd.Series([captions.normalise_caption(caption) for caption in unique_captions]).to_numpy()[caption_codes])
+        rows = rows.assign(occurrence=rows.groupby(["url", "period", "caption_key"], sort=False).cumcount())
+        rows = rows.sort_values(["filing_date", "url", "line"], ascending=[False, False, True], kind="stable")
+        rows = rows.assign(filing_rank=pd.factorize(rows["url"])[0])
+
+        line_items = rows.drop_duplicates(["caption_key", "occurrence"]).set_index(["caption_key", "occurrence"])
+        line_items = line_items.sort_values(["filing_rank", "line"])
+        latest_values = rows.drop_duplicates(["caption_key", "occurrence", "duration", "period_end"])
+
+        statement_df = latest_values.pivot(index=["caption_key", "occurrence"], columns=["period_end", "duration"], values="value")
+        statement_df = statement_df.reindex(index=line_items.index, columns=sorted(statement_df.columns, key=period_order))
+        statement_df.columns = [period_label(duration, period_end) for period_end, duration in statement_df.columns]
+        statement_df.insert(0, "Captions", line_items["Captions"])
+        return statement_df.reset_index(drop=True)
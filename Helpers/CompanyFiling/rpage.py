@@ -0,0 +1,164 @@
+from lxml import html as lxml_html
+import io
+import numpy as np
+import pandas as pd
+import re
+
+
+REPORT_TABLE_XPATH = "//table[contains(concat(' ', normalize-space(@class), ' '), ' report ')]"
+WHITESPACE_REGEX = re.compile(r"[\r\n]+|\s{2,}")
+MONETARY_SCALE_REGEX = re.compile(r"\$ (in [A-Z][a-z]+)")
+SHARE_SCALE_REGEX = re.compile(r"shares (in [A-Z][a-z]+)")
+ANY_SCALE_REGEX = re.compile(r"(in [A-Z][a-z]+)")
+PLAIN_NUMBER_REGEX = re.compile(r"^[+-]?\d[\d,]*(?:\.\d*)?$")
+SCALE_MAP = {"in ones": 1, "in thousands": 1_000, "in millions": 1_000_000, "in billions": 1_000_000_000}
+
+
+class ReportTableNotFound(ValueError):
+    pass
+
+
+def cell_text(cell):
+    # Same normalisation pd.read_html applies, so both parsers produce identical labels.
+    return WHITESPACE_REGEX.sub(" ", cell.text_content()).strip()
+
+
+def scale_from_caption(caption, regex):
+    match = regex.search(caption)
+    return SCALE_MAP.get(match.group(1).lower()) if match else None
+
+
+class ReportTable:
+
+    """
+    Report Table Class\n
+    One EDGAR rendered statement page (R2.htm, R4.htm, ...) read straight from its table.report element.
+
+    caption: the title cell, e.g. "CONDENSED CONSOLIDATED BALANCE SHEETS - USD ($) $ in Thousands".
+    header_rows: the header grid with rowspan / colspan expanded, one list per header row (first entry is the caption).
+    periods: one label per value column, e.g. "3 Months Ended Jun. 30, 2021".
+    scale / share_scale: multipliers from the caption ("$ in Thousands" -> 1_000, "shares in Millions" -> 1_000_000).
+    rows: (line item label, [raw cell text or None, ...]) for every body row.
+    """
+
+    def __init__(self, caption, header_rows, rows):
+        self.caption = caption
+        self.header_rows = header_rows
+        self.rows = rows
+        self.periods = [" ".join(dict.fromkeys(label for label in column if label)) for column in zip(*header_rows)][1:]
+        self.scale = scale_from_caption(caption, MONETARY_SCALE_REGEX) or scale_from_caption(caption, ANY_SCALE_REGEX) or 1
+        self.share_scale = scale_from_caption(caption, SHARE_SCALE_REGEX) or 1
+
+
+    def to_frame(self):
+        """
+        Purpose: Build the dataframe pd.read_html would have returned for this table: MultiIndex columns when the header has two rows,
+        NaN for empty cells, commas dropped from plain numbers and columns converted to numbers only when every cell is a plain (comma separated) number.
+        Inputs: None.
+        Output: dataframe.
+        """
+        width = len(self.header_rows[0])
+        data = [[label] + (cells + [None] * width)[: width - 1] for label, cells in self.rows]
+        header_rows = [
+            [label or f"Unnamed: {position}_level_{level}" for position, label in enumerate(header_row)]
+            for level, header_row in enumerate(self.header_rows)
+        ]
+        if len(header_rows) == 1:
+            columns = pd.Index([label.replace("_level_0", "") for label in header_rows[0]])
+        else:
+            columns = pd.MultiIndex.from_arrays(header_rows)
+        frame = pd.DataFrame({position: read_html_column(values) for position, values in enumerate(zip(*data))}, columns=range(width))
+        frame.columns = columns
+        return frame
+
+
+def read_html_column(values):
+    # Like read_html's thousands="," handling: plain numbers lose their commas, and a column becomes numeric only if all of it is.
+    plain_numbers = [value is not None and PLAIN_NUMBER_REGEX.match(value) is not None for value in values]
+    if all(is_plain or value is None for value, is_plain in zip(values, plain_numbers)) and any(plain_numbers):
+        return [np.nan if value is None else float(value.replace(",", "")) if "." in value else int(value.replace(",", "")) for value in values]
+    return [np.nan if value is None else value.replace(",", "") if is_plain else value for value, is_plain in zip(values, plain_numbers)]
+
+
+def expand_header_rows(header_rows):
+    grid = list()
+    pending_rowspans = dict()
+    for row in header_rows:
+        expanded = list()
+        position = 0
+        cells = iter(row)
+        while True:
+            if position in pending_rowspans:
+                text, remaining = pending_rowspans[position]
+                expanded.append(text)
+                if remaining == 1:
+                    del pending_rowspans[position]
+                else:
+                    pending_rowspans[position] = (text, remaining - 1)
+                position += 1
+                continue
+            cell = next(cells, None)
+            if cell is None:
+                break
+            text = cell_text(cell)
+            colspan = int(cell.get("colspan", 1) or 1)
+            rowspan = int(cell.get("rowspan", 1) or 1)
+            for _ in range(colspan):
+                if rowspan > 1:
+                    pending_rowspans[position] = (text, rowspan - 1)
+                expanded.append(text)
+                position += 1
+        grid.append(expanded)
+
+    width = max(len(row) for row in grid)
+    return [row + [""] * (width - len(row)) for row in grid]
+
+
+def parse_report_table(report_html):
+    """
+    Purpose: Single pass lxml parser for EDGAR's rendered R pages. Only the first table.report is read; rows holding nested tables
+    (footnotes) are skipped.
+    Inputs: R page html (bytes or str).
+    Output: ReportTable. Raises ReportTableNotFound when the page has no table.report (callers fall back to pd.read_html).
+    """
+    document = lxml_html.fromstring(report_html)
+    tables = document.xpath(REPORT_TABLE_XPATH)
+    if not tables:
+        raise ReportTableNotFound("No table.report element found")
+    for line_break in tables[0].iter("br"):
+        line_break.tail = "\n" + (line_break.tail or "")
+
+    header_rows, rows = list(), list()
+    for row in tables[0].xpath("./tr | ./thead/tr | ./tbody/tr"):
+        cells = row.xpath("./th | ./td")
+        if not cells or row.xpath(".//table"):
+            continue
+        if all(cell.tag == "th" for cell in cells):
+            header_rows.append(cells)
+            continue
+
+        values = list()
+        for cell in cells[1:]:
+            text = cell_text(cell) or None
+            values += [text] * int(cell.get("colspan", 1) or 1)
+        rows.append((cell_text(cells[0]) or None, values))
+
+    if not header_rows:
+        raise ReportTableNotFound("table.report has no header row")
+
+    header_grid = expand_header_rows(header_rows)
+    return ReportTable(header_grid[0][0], header_grid, rows)
+
+
+def read_report_frame(report_html):
+    """
+    Purpose: Parse an R page into a dataframe, using parse_report_table when the page has EDGAR's table.report layout and pd.read_html otherwise.
+    Inputs: R page html (bytes or str).
+    Output: (dataframe, ReportTable or None when the fallback was used).
+    """
+    try:
+        report_table = parse_report_table(report_html)
+    except ReportTableNotFound:
+        report_buffer = io.BytesIO(report_html) if isinstance(report_html, bytes) else io.StringIO(report_html)
+        return pd.read_html(report_buffer)[0], None
+    return report_table.to_frame(), report_table
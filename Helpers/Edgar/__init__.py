@@ -0,0 +1 @@
+# initialize Edgar module
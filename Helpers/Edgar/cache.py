@@ -0,0 +1,383 @@
+import atexit
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+
+
+DEFAULT_CACHE_DIRECTORY = os.path.join(os.path.expanduser("~"), ".cache", "financial-statements", "edgar")
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+DEFAULT_INDEX_TTL = 24 * 60 * 60
+# Expired entries are purged at most this often (get() drops an expired entry anyway), and eviction frees space down to this share of
+# max_bytes so that it does not run again on the very next put.
+EVICT_INTERVAL = 10 * 60
+EVICT_LOW_WATER = 0.9
+
+# Documents inside an accession folder (e.g. /Archives/edgar/data/1512673/000162828021015094/R2.htm) never change once filed.
+# Everything else (directory listings, browse-edgar, submissions json) is an index page and can change at any time.
+IMMUTABLE_URL_REGEX = re.compile(r"/Archives/edgar/data/\d+/\d{18}/[^/?]+$")
+
+
+def is_immutable_url(url):
+    return bool(IMMUTABLE_URL_REGEX.search(url))
+
+
+class CacheStats:
+
+    """
+    Hit / miss counters for a ResponseCache. Counters are per process.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.bytes_stored = 0
+        self.evictions = 0
+
+    def as_dict(self):
+        return dict(hits=self.hits, misses=self.misses, bytes_saved=self.bytes_saved, bytes_stored=self.bytes_stored, evictions=self.evictions)
+
+    def __repr__(self):
+        return "CacheStats(" + ", ".join(f"{key}={value:,}" for key, value in self.as_dict().items()) + ")"
+
+
+class ResponseCache:
+
+    """
+    Response Cache Class\n
+    Persistent on-disk cache for EDGAR responses. Bodies are stored once per content hash under objects/ and an sqlite index maps each url to
+    its content hash, so the same document served under two urls (e.g. the iXBRL viewer and the raw archive) is only stored once.
+    The index is shared between processes; eviction is least-recently-used once the stored bytes exceed max_bytes. Each process keeps a
+    running total of the stored bytes, so a put only triggers eviction when that total is over budget or every EVICT_INTERVAL seconds;
+    eviction recounts the total from the index, which picks up what other processes stored or removed.
+    Immutable archive documents never expire, index pages expire after index_ttl seconds (None to never expire).
+
+    Use:\n
+    cache = ResponseCache("/tmp/edgar-cache")
+    cache.put(url, content)
+    content = cache.get(url)
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIRECTORY, max_bytes=DEFAULT_MAX_BYTES, index_ttl=DEFAULT_INDEX_TTL):
+        self.directory = directory
+        self.objects_directory = os.path.join(directory, "objects")
+        self.max_bytes = max_bytes
+        self.index_ttl = index_ttl
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._connection = None
+        self._connection_pid = None
+        self._stored_bytes = None
+        self._evicted_at = None
+        os.makedirs(self.objects_directory, exist_ok=True)
+        with self._lock:
+            self._connect().execute(
+                """
+                CREATE TABLE IF NOT EXISTS entries (
+                    url TEXT PRIMARY KEY,
+                    digest TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    encoding TEXT,
+                    stored_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    expires_at REAL
+                )
+                """
+            )
+            self._connect().execute("CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)")
+            self._connect().execute("CREATE INDEX IF NOT EXISTS entries_digest ON entries (digest)")
+            self._connect().execute("CREATE INDEX IF NOT EXISTS entries_expires_at ON entries (expires_at)")
+
+
+    def _connect(self):
+        # sqlite connections must not be shared across a fork, so reconnect when the pid changes.
+        if self._connection is None or self._connection_pid != os.getpid():
+            self._connection = sqlite3.connect(
+                os.path.join(self.directory, "index.sqlite"), timeout=60, isolation_level=None, check_same_thread=False
+            )
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection_pid = os.getpid()
+        return self._connection
+
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects_directory, digest[:2], digest)
+
+
+    def ttl_for(self, url):
+        return None if is_immutable_url(url) else self.index_ttl
+
+
+    def get(self, url):
+        """
+        Purpose: Return the cached body for a url, or None when the url has not been cached or has expired.
+        Inputs: url.
+        Output: (content bytes, encoding) or None.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._connect().execute("SELECT digest, size, encoding, expires_at FROM entries WHERE url = ?", (url,)).fetchone()
+            if row is not None and row[3] is not None and row[3] < now:
+                self._connect().execute("DELETE FROM entries WHERE url = ?", (url,))
+                self._remove_orphaned_object(row[0], row[1])
+                row = None
+            if row is not None:
+                self._connect().execute("UPDATE entries SET accessed_at = ? WHERE url = ?", (now, url))
+
+        if row is None:
+            self.stats.misses += 1
+            return None
+
+        digest, size, encoding, _ = row
+        try:
+            with open(self._object_path(digest), "rb") as cached_file:
+                content = cached_file.read()
+        except FileNotFoundError:
+            # Evicted by another process between the index lookup and the read.
+            self.stats.misses += 1
+            return None
+
+        self.stats.hits += 1
+        self.stats.bytes_saved += size
+        return content, encoding
+
+
+    def put(self, url, content, encoding=None, ttl="default"):
+        """
+        Purpose: Store a response body for a url. Bodies are written to a temporary file and renamed into place so that readers in other
+        processes never see a partial file.
+        Inputs: url, content bytes, the response encoding and an optional ttl in seconds (defaults to the url's ttl policy).
+        Output: None.
+        """
+        if ttl == "default":
+            ttl = self.ttl_for(url)
+        digest = hashlib.sha256(content).hexdigest()
+        object_path = self._object_path(digest)
+
+        if not os.path.exists(object_path):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            file_descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(object_path))
+            with os.fdopen(file_descriptor, "wb") as temporary_file:
+                temporary_file.write(content)
+            os.replace(temporary_path, object_path)
+
+        now = time.time()
+        expires_at = None if ttl is None else now + ttl
+        with self._lock:
+            previous = self._connect().execute("SELECT digest, size FROM entries WHERE url = ?", (url,)).fetchone()
+            is_new_object = self._connect().execute("SELECT 1 FROM entries WHERE digest = ? LIMIT 1", (digest,)).fetchone() is None
+            self._connect().execute(
+                "INSERT OR REPLACE INTO entries (url, digest, size, encoding, stored_at, accessed_at, expires_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, digest, len(content), encoding, now, now, expires_at),
+            )
+            if previous is not None and previous[0] != digest:
+                self._remove_orphaned_object(*previous)
+            if self._stored_bytes is not None and is_new_object:
+                self._stored_bytes += len(content)
+            needs_eviction = self._stored_bytes is None or time.monotonic() - self._evicted_at > EVICT_INTERVAL
+            needs_eviction = needs_eviction or (self.max_bytes is not None and self._stored_bytes > self.max_bytes)
+        self.stats.bytes_stored += len(content)
+        if needs_eviction:
+            self.evict()
+
+
+    def _remove_orphaned_object(self, digest, size=0):
+        # Removes the body once no url refers to it any more; returns True when it was removed.
+        still_referenced = self._connect().execute("SELECT 1 FROM entries WHERE digest = ? LIMIT 1", (digest,)).fetchone()
+        if still_referenced is not None:
+            return False
+        if self._stored_bytes is not None:
+            self._stored_bytes -= size
+        try:
+            os.remove(self._object_path(digest))
+        except FileNotFoundError:
+            pass
+        return True
+
+
+    def total_bytes(self):
+        # Counted from the index, so it includes what other processes stored
+        with self._lock:
+            return self._total_bytes()
+
+
+    def _total_bytes(self):
+        return self._connect().execute("SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT digest, size FROM entries)").fetchone()[0]
+
+
+    def evict(self):
+        """
+        Purpose: Remove expired entries, then, once the stored bytes exceed max_bytes, the least recently used entries until they fit in
+        EVICT_LOW_WATER of it. Called by put() when needed.
+        Inputs: None.
+        Output: Number of entries removed.
+        """
+        removed = 0
+        with self._lock:
+            connection = self._connect()
+            self._evicted_at = time.monotonic()
+            self._stored_bytes = self._total_bytes()
+            expired = connection.execute("SELECT url, digest, size FROM entries WHERE expires_at < ?", (time.time(),)).fetchall()
+            for url, digest, size in expired:
+                connection.execute("DELETE FROM entries WHERE url = ?", (url,))
+                self._remove_orphaned_object(digest, size)
+                removed += 1
+
+            if self.max_bytes is not None and self._stored_bytes > self.max_bytes:
+                for url, digest, size in connection.execute("SELECT url, digest, size FROM entries ORDER BY accessed_at").fetchall():
+                    if self._stored_bytes <= self.max_bytes * EVICT_LOW_WATER:
+                        break
+                    connection.execute("DELETE FROM entries WHERE url = ?", (url,))
+                    self._remove_orphaned_object(digest, size)
+                    removed += 1
+
+        self.stats.evictions += removed
+        return removed
+
+
+    def invalidate(self, url):
+        with self._lock:
+            row = self._connect().execute("SELECT digest, size FROM entries WHERE url = ?", (url,)).fetchone()
+            if row is not None:
+                self._connect().execute("DELETE FROM entries WHERE url = ?", (url,))
+                self._remove_orphaned_object(*row)
+
+
+    def clear(self):
+        with self._lock:
+            digests = [row[0] for row in self._connect().execute("SELECT DISTINCT digest FROM entries").fetchall()]
+            self._connect().execute("DELETE FROM entries")
+            for digest in digests:
+                self._remove_orphaned_object(digest)
+            self._stored_bytes = 0
+
+
+    def __len__(self):
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+class JsonStore:
+
+    """
+    Json Store Class\n
+    Small persistent key -> value map for derived data that is cheap to keep but costly to recompute (caption classifications,
+    resolved report slugs). Values are held in memory and merged into a single json file on save(); the file carries a version so a
+    format or rule change simply starts over. Without a path the store lives in memory only.
+
+    Use:\n
+    store = JsonStore("slugs.json")
+    store.put(base_url, dict(BS="R2.htm", IS="R4.htm", CF="R7.htm"))
+    store.save()
+    """
+
+    def __init__(self, path=None, version=1):
+        self.path = path
+        self.version = version
+        self.unsaved = 0
+        self._lock = threading.Lock()
+        self.values = self.read() if path is not None else dict()
+
+
+    def __contains__(self, key):
+        return key in self.values
+
+
+    def __len__(self):
+        return len(self.values)
+
+
+    def read(self):
+        try:
+            with open(self.path) as store_file:
+                stored = json.load(store_file)
+        except (OSError, ValueError):
+            return dict()
+        return stored.get("values", dict()) if stored.get("version") == self.version else dict()
+
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+
+    def put(self, key, value):
+        with self._lock:
+            self.values[key] = value
+            self.unsaved += 1
+
+
+    def save(self):
+        """
+        Purpose: Merge the values added in this process into the json file, written atomically (no-op without a path or new values).
+        Inputs: None.
+        Output: None.
+        """
+        if self.path is None or not self.unsaved:
+            return
+        with self._lock:
+            values = {**self.read(), **self.values}
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            file_descriptor, temporary_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(file_descriptor, "w") as store_file:
+                json.dump(dict(version=self.version, values=values), store_file)
+            os.replace(temporary_path, self.path)
+            self.unsaved = 0
+
+
+_UNSET = object()
+_default_cache = _UNSET
+_json_stores = dict()
+_json_stores_lock = threading.Lock()
+
+
+def get_default_cache():
+    """
+    Purpose: Return the process-wide cache used by make_edgar_request. The directory can be moved with the EDGAR_CACHE_DIR environment variable.
+    Inputs: None.
+    Output: ResponseCache or None when caching has been disabled with set_default_cache(None).
+    """
+    global _default_cache
+    if _default_cache is _UNSET:
+        _default_cache = ResponseCache(os.environ.get("EDGAR_CACHE_DIR", DEFAULT_CACHE_DIRECTORY))
+    return _default_cache
+
+
+def set_default_cache(cache):
+    """
+    Purpose: Replace the process-wide cache (None disables caching). The json stores live next to it, so they are saved and reopened
+    for the new cache the next time they are asked for.
+    Inputs: ResponseCache or None.
+    Output: the previous setting, which set_default_cache accepts to restore it.
+    """
+    global _default_cache
+    with _json_stores_lock:
+        save_json_stores()
+        _json_stores.clear()
+    previous, _default_cache = _default_cache, cache
+    return previous
+
+
+def get_json_store(name, version=1):
+    """
+    Purpose: Return the process-wide JsonStore called name, kept as <name>.json in the default cache directory and saved on exit.
+    Inputs: store name and its format version.
+    Output: JsonStore (memory only when caching has been disabled with set_default_cache(None)).
+    """
+    with _json_stores_lock:
+        if name not in _json_stores:
+            response_cache = get_default_cache()
+            path = os.path.join(response_cache.directory, name + ".json") if response_cache is not None else None
+            _json_stores[name] = JsonStore(path, version)
+        return _json_stores[name]
+
+
+@atexit.register
+def save_json_stores():
+    for store in list(_json_stores.values()):
+        store.save()
@@ -0,0 +1,182 @@
+from . import cache
+from .. import instrumentation
+from requests.adapters import HTTPAdapter
+import email.utils
+import requests
+import threading
+import time
+
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.131 Safari/537.36",
+    "Accept-Encoding": "gzip, deflate",
+}
+
+# SEC fair access policy: no more than 10 requests per second per client.
+SEC_REQUESTS_PER_SECOND = 10
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class TokenBucket:
+
+    """
+    Thread-safe token bucket. acquire() blocks until a token is available, so the long run rate never exceeds `rate` per second
+    while still allowing a burst of `capacity` requests after an idle period.
+    """
+
+    def __init__(self, rate=SEC_REQUESTS_PER_SECOND, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def retry_after_seconds(response):
+    retry_after = response.headers.get("Retry-After")
+    if retry_after is None:
+        return None
+    if retry_after.strip().isdigit():
+        return int(retry_after)
+    retry_at = email.utils.parsedate_to_datetime(retry_after)
+    return max(0, retry_at.timestamp() - time.time())
+
+
+def cached_response(url, content, encoding):
+    """
+    Purpose: Wrap a cached body in a requests.Response so callers can keep using .text, .content and .status_code.
+    Inputs: url, content bytes and the encoding recorded when the response was stored.
+    Output: requests.Response object.
+    """
+    response = requests.Response()
+    response.url = url
+    response.status_code = 200
+    response._content = content
+    response.encoding = encoding
+    response.headers["X-Edgar-Cache"] = "hit"
+    return response
+
+
+class EdgarSession:
+
+    """
+    EDGAR Session Class\n
+    One keep-alive connection pool shared by every request, a token bucket that keeps the client under SEC's 10 requests/second limit,
+    retries with exponential backoff (honouring Retry-After) on 429 and 5xx responses, and the on-disk response cache in front of it all.
+    A single session is safe to share between threads; Filing, XBRLReport and fsmetrics all accept one through their `session` argument.
+
+    Use:\n
+    session = EdgarSession(rate_limit=5)
+    filing = Filing.Filing(filing_url, session=session)
+    """
+
+    def __init__(
+        self,
+        rate_limit=SEC_REQUESTS_PER_SECOND,
+        pool_maxsize=16,
+        max_retries=5,
+        backoff_factor=0.5,
+        timeout=30,
+        headers=None,
+        response_cache=cache.get_default_cache,
+    ):
+        if response_cache is cache.get_default_cache:
+            response_cache = cache.get_default_cache()
+        self.response_cache = response_cache
+        self.rate_limiter = TokenBucket(rate_limit) if rate_limit else None
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS if headers is None else headers)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+
+    def get(self, url):
+        """
+        Purpose: Fetch a url through the cache, rate limiter and retry policy.
+        Inputs: url.
+        Output: requests.Response object (the last response if every retry failed).
+        """
+        if self.response_cache is not None:
+            cached = self.response_cache.get(url)
+            if cached is not None:
+                content, encoding = cached
+                instrumentation.count("cache_hits")
+                return cached_response(url, content, encoding)
+            instrumentation.count("cache_misses")
+
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter is not None:
+                with instrumentation.timer("rate_limit_wait"):
+                    self.rate_limiter.acquire()
+            try:
+                with instrumentation.timer("http_request", key=url):
+                    response = self.session.get(url, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                instrumentation.count("http_retries")
+                time.sleep(self.backoff_factor * 2 ** attempt)
+                continue
+
+            instrumentation.count("http_requests")
+            instrumentation.count("bytes_downloaded", len(response.content))
+            if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                break
+            instrumentation.count("http_retries")
+            wait = retry_after_seconds(response)
+            time.sleep(wait if wait is not None else self.backoff_factor * 2 ** attempt)
+
+        if self.response_cache is not None and response.status_code == 200:
+            self.response_cache.put(url, response.content, encoding=response.encoding)
+        return response
+
+
+    def close(self):
+        self.session.close()
+
+
+_default_session = None
+_default_session_lock = threading.Lock()
+
+
+def get_default_session():
+    global _default_session
+    with _default_session_lock:
+        if _default_session is None:
+            _default_session = EdgarSession()
+        return _default_session
+
+
+def set_default_session(session):
+    global _default_session
+    with _default_session_lock:
+        previous, _default_session = _default_session, session
+    return previous
+
+
+def make_edgar_request(url, session=None):
+    """
+    Purpose: Request an EDGAR document through the shared EdgarSession (cache, connection pool, rate limit and retries).
+    Inputs: url and optionally the EdgarSession to use instead of the process-wide default.
+    Output: requests.Response object.
+    """
+    if session is None:
+        session = get_default_session()
+    return session.get(url)
@@ -0,0 +1,81 @@
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from collections import namedtuple
+from .. import instrumentation
+import itertools
+import os
+
+
+BatchResult = namedtuple("BatchResult", ["url", "result", "error"])
+
+
+def run_batch(urls, fetch, parse, session=None, max_workers=10, parse_workers=None, max_pending=None, ordered=False):
+    """
+    Purpose: Fetch many EDGAR documents on a bounded thread pool and parse them on a process pool, yielding each result as soon as it is ready.
+    The global request rate is bounded by the (shared) session's rate limiter, not by max_workers. A failure only affects its own url.
+    Inputs: urls, fetch(url, session=, page_pool=) returning a picklable payload, parse(payload) (a module level function so it can be sent
+    to a worker process), optionally the session, the number of fetch threads and the number of parse processes
+    (None for one per CPU, 0 to parse on the fetch threads), optionally the most urls in flight at once (fetched or parsed but not
+    yet yielded), which bounds the payloads held in memory (by default every url is queued at once), and ordered to yield in the order
+    of urls. Results that finish ahead of an earlier url are held until it is done and still count towards max_pending.
+    Output: generator of BatchResult(url, result, error) in completion order, or in the order of urls when ordered.
+    """
+    if parse_workers is None:
+        parse_workers = os.cpu_count() or 1
+
+    filing_pool = ThreadPoolExecutor(max_workers)
+    page_pool = ThreadPoolExecutor(max_workers)
+    parse_pool = ProcessPoolExecutor(parse_workers) if parse_workers else None
+    pending_urls, finished = dict(), dict()
+    next_position = 0
+    # Worker processes collect their own stats; they come back with each result and are merged here.
+    stats = instrumentation.active_stats()
+
+    def fetch_and_maybe_parse(url):
+        payload = fetch(url, session=session, page_pool=page_pool)
+        return payload if parse_pool is not None else parse(payload)
+
+    try:
+        url_iterator = enumerate(urls)
+
+        def submit_next(count):
+            for position, url in itertools.islice(url_iterator, count):
+                pending_urls[filing_pool.submit(fetch_and_maybe_parse, url)] = (url, position, "fetch")
+
+        def release(position, batch_result):
+            # A url only makes room for the next one once its result is yielded.
+            nonlocal next_position
+            finished[position if ordered else next_position] = batch_result
+            while next_position in finished:
+                batch_result = finished.pop(next_position)
+                next_position += 1
+                submit_next(1)
+                yield batch_result
+
+        submit_next(max_pending)
+
+        while pending_urls:
+            done, _ = wait(pending_urls, return_when=FIRST_COMPLETED)
+            for future in done:
+                url, position, stage = pending_urls.pop(future)
+                try:
+                    result = future.result()
+                except Exception as error:
+                    yield from release(position, BatchResult(url, None, error))
+                    continue
+
+                if stage == "fetch" and parse_pool is not None and stats is not None:
+                    pending_urls[parse_pool.submit(instrumentation.call_collecting, parse, result)] = (url, position, "parse")
+                elif stage == "fetch" and parse_pool is not None:
+                    pending_urls[parse_pool.submit(parse, result)] = (url, position, "parse")
+                else:
+                    if stage == "parse" and stats is not None:
+                        result, worker_stats = result
+                        stats.merge(worker_stats)
+                    yield from release(position, BatchResult(url, result, None))
+    finally:
+        for future in pending_urls:
+            future.cancel()
+        filing_pool.shutdown(wait=False, cancel_futures=True)
+        page_pool.shutdown(wait=False, cancel_futures=True)
+        if parse_pool is not None:
+            parse_pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,92 @@
+from .client import make_edgar_request
+import json
+import os
+import pandas as pd
+
+
+SUBMISSIONS_URL = "https://data.sec.gov/submissions/CIK{cik:010d}.json"
+SUBMISSIONS_PAGE_URL = "https://data.sec.gov/submissions/{name}"
+ARCHIVE_URL = "https://www.sec.gov/Archives/edgar/data/{cik}/{folder}/{document}"
+PERIODIC_FORMS = ("10-Q", "10-K")
+
+
+def filing_index(cik, session=None, complete=False):
+    """
+    Purpose: List an issuer's recent filings from the EDGAR submissions api (data.sec.gov), newest first.
+    Inputs: CIK (int or str, with or without leading zeros), optionally the EdgarSession and complete=True to also read the older
+    submission pages (the recent list stops after a year or 1,000 filings, whichever is more).
+    Output: dataframe with accession, form, report_date, filing_date, primary_document and the filing url.
+    """
+    submissions = fetch_submissions(SUBMISSIONS_URL.format(cik=int(cik)), session)
+    pages = [submissions["filings"]["recent"]]
+    if complete:
+        pages += [fetch_submissions(SUBMISSIONS_PAGE_URL.format(name=page["name"]), session) for page in submissions["filings"].get("files", [])]
+    return index_from_submissions(pages, cik)
+
+
+def fetch_submissions(url, session=None):
+    edgar_request = make_edgar_request(url, session=session)
+    edgar_request.raise_for_status()
+    return edgar_request.json()
+
+
+def index_from_submissions(pages, cik):
+    # pages: the "recent" block of a submissions json and / or older submission pages, which share its columns.
+    index_df = pd.concat([
+        pd.DataFrame(dict(
+            accession=page["accessionNumber"],
+            form=page["form"],
+            report_date=page["reportDate"],
+            filing_date=page["filingDate"],
+            primary_document=page["primaryDocument"],
+        ))
+        for page in pages
+    ], ignore_index=True)
+    index_df["url"] = [
+        ARCHIVE_URL.format(cik=int(cik), folder=accession.replace("-", ""), document=document)
+        for accession, document in zip(index_df["accession"], index_df["primary_document"])
+    ]
+    return index_df.sort_values(["filing_date", "accession"], ascending=False, ignore_index=True)
+
+
+def load_filing_index(path, cik=None):
+    """
+    Purpose: Read a filing index kept on disk instead of calling the submissions api: a submissions json downloaded from data.sec.gov (older
+    pages listed in it are read too when they sit next to it), a single submissions page, or a csv / parquet file written from filing_index.
+    Inputs: path, and the CIK when the file does not name it (submission pages, csv / parquet without a url column).
+    Output: dataframe like filing_index.
+    """
+    if path.endswith(".json"):
+        with open(path) as submissions_file:
+            submissions = json.load(submissions_file)
+        if "filings" not in submissions:
+            return index_from_submissions([submissions], cik)
+        pages = [submissions["filings"]["recent"]]
+        for page in submissions["filings"].get("files", []):
+            page_path = os.path.join(os.path.dirname(path), page["name"])
+            if os.path.exists(page_path):
+                with open(page_path) as page_file:
+                    pages.append(json.load(page_file))
+        return index_from_submissions(pages, submissions.get("cik", cik))
+
+    index_df = pd.read_parquet(path) if path.endswith(".parquet") else pd.read_csv(path, dtype=str)
+    if "url" not in index_df.columns:
+        index_df["url"] = [
+            ARCHIVE_URL.format(cik=int(cik), folder=accession.replace("-", ""), document=document)
+            for accession, document in zip(index_df["accession"], index_df["primary_document"])
+        ]
+    return index_df
+
+
+def find_filing_url(cik, period, forms=PERIODIC_FORMS, session=None):
+    """
+    Purpose: Resolve an issuer and a period end to the filing that reports it.
+    Inputs: CIK, period end (anything pd.Timestamp reads, e.g. "2021-06-30" or "20210630"), accepted form types, optionally the EdgarSession.
+    Output: filing url of the latest matching filing. Raises LookupError when there is none.
+    """
+    report_date = pd.Timestamp(period).strftime("%Y-%m-%d")
+    index_df = filing_index(cik, session=session)
+    matches = index_df[(index_df["report_date"] == report_date) & index_df["form"].isin(forms)]
+    if matches.empty:
+        raise LookupError(f"No {'/'.join(forms)} filing for CIK {cik} with period {report_date}")
+    return matches["url"].iloc[0]
@@ -1,52 +1,110 @@
 from bs4 import BeautifulSoup
+from ..Edgar.client import make_edgar_request
+from ..Edgar.concurrency import run_batch
+from .. import instrumentation
+from lxml import etree
+import functools
+import io
+import logging
+import numpy as np
+import os
 import pandas as pd
-import requests
- 
+from pandas.api.types import union_categoricals
+import tempfile
 
-def make_edgar_request(url):
-    headers = {"User-Agent" : "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.131 Safari/537.36"}
-    edgar_request = requests.get(url, headers=headers)
-    return edgar_request
+logger = logging.getLogger(__name__)
 
+XLINK_HREF = "{http://www.w3.org/1999/xlink}href"
 
-def parse_xml_tree(filing_url):
+
+def parse_xml_tree(filing_url, session=None):
     """
     Purpose: Take an Edgar Filing and covert it into the XML url. Parse the url and return the BeautifulSoup object.
-    Inputs: Edgar Filing URL (iXBRL or HTML will work).
+    Inputs: Edgar Filing URL (iXBRL or HTML will work) and optionally the EdgarSession to fetch it with.
     Output: BeautifulSoup object.
     """
 
-    xml_url = filing_url.replace("ix?doc=/", "").replace(".htm", "_htm.xml")
+    xml_url = convert_filing_to_instance_url(filing_url)
 
-    edgar_request = make_edgar_request(xml_url)
+    edgar_request = make_edgar_request(xml_url, session=session)
     soup = BeautifulSoup(edgar_request.text, 'xml')
     return soup
 
 
+def convert_filing_to_instance_url(filing_url):
+    return filing_url.replace("ix?doc=/", "").replace(".htm", "_htm.xml")
+
+
+def fetch_instance(filing_url, session=None, page_pool=None):
+    edgar_request = make_edgar_request(convert_filing_to_instance_url(filing_url), session=session)
+    edgar_request.raise_for_status()
+    return edgar_request.content
+
+
+def facts_from_instance(instance_xml, parser="stream"):
+    """
+    Purpose: Parse the raw XBRL instance document into the facts dataframes. Runs in a worker process during XBRLReport.from_urls.
+    Inputs: XBRL instance document (bytes or str) and the parser: "stream" (iterparse, see iterparse_instance) or "soup" (BeautifulSoup tree).
+    Output: (numeric facts dataframe, text facts dataframe) (see merge_facts_and_context).
+    """
+    with instrumentation.timer("parse_instance"):
+        if parser == "soup":
+            facts_df, text_facts_df = merge_facts_and_context(retrieve_tags(BeautifulSoup(instance_xml, 'xml')))
+        else:
+            facts_df, text_facts_df = facts_frames_from_buffers(iterparse_instance(instance_xml))
+    instrumentation.count("facts", len(facts_df))
+    instrumentation.count("text_facts", len(text_facts_df))
+    return facts_df, text_facts_df
+
+
+def format_context_date(instant=None, start_date=None, end_date=None):
+    if instant is not None:
+        instant_date_year_month_day = instant.split("-")
+        return f"{instant_date_year_month_day[1]}/{instant_date_year_month_day[2]}/{instant_date_year_month_day[0]}"
+    start_date_year_month_day = start_date.split("-")
+    end_date_year_month_day = end_date.split("-")
+    start_date = f"{start_date_year_month_day[1]}/{start_date_year_month_day[2]}/{start_date_year_month_day[0]}"
+    end_date = f"{end_date_year_month_day[1]}/{end_date_year_month_day[2]}/{end_date_year_month_day[0]}"
+    return f"{start_date} to {end_date}"
+
+
+def format_unit_measure(numerator_measures, denominator_measures=()):
+    measure = "*".join(numerator_measures)
+    if denominator_measures:
+        measure = f"{measure}/{'*'.join(denominator_measures)}"
+    return measure
+
+
 def extract_context_tag_info(context_tag):
     """
     Purpose: Each XBRL filing contains a lot of facts tags. It seems that instead of adding all of the context (i.e., dimensions and axis) attributes
     to each tag, in an effort to save space, Edgar puts all of the unique context combinations in a separate tag. Each fact tag will have a unique context 
     reference that will match one context tag id. The context tag will contain all the dimensions and dates associated with that fact tag. 
     Inputs: List of context tags.
-    Output: Dictionary of uids, dates, and dimensions. Can convert to dataframe to merge on the uid column.
+    Output: Dictionary of uid, the raw start, end and instant dates, and dimensions, as taken by InstanceBuffers.add_context.
     """
     uid = context_tag["id"]
 
     if context_tag.find("instant"):
-        instant_date_year_month_day = context_tag.find("instant").text.split("-")
-        date = f"{instant_date_year_month_day[1]}/{instant_date_year_month_day[2]}/{instant_date_year_month_day[0]}"
+        start, end, instant = None, None, context_tag.find("instant").text
     else:
-        start_date_year_month_day = context_tag.find("startDate").text.split("-")
-        end_date_year_month_day = context_tag.find("endDate").text.split("-")
-        start_date = f"{start_date_year_month_day[1]}/{start_date_year_month_day[2]}/{start_date_year_month_day[0]}"
-        end_date = f"{end_date_year_month_day[1]}/{end_date_year_month_day[2]}/{end_date_year_month_day[0]}"
-        date = f"{start_date} to {end_date}"
+        start, end, instant = context_tag.find("startDate").text, context_tag.find("endDate").text, None
 
     explicit_members = context_tag.find_all("explicitMember")
     dimensions = "\n".join( [f"{explicit_member['dimension']} [{explicit_member.text}]" for explicit_member in explicit_members] )
 
-    return dict(uid=uid, date=date, dimensions=dimensions)
+    return dict(uid=uid, start=start, end=end, instant=instant, dimensions=dimensions)
+
+
+def extract_unit_tag_info(unit_tag):
+    numerator_tag = unit_tag.find("unitNumerator")
+    if numerator_tag:
+        measure = format_unit_measure(
+            [tag.text for tag in numerator_tag.find_all("measure")], [tag.text for tag in unit_tag.find("unitDenominator").find_all("measure")]
+        )
+    else:
+        measure = format_unit_measure([tag.text for tag in unit_tag.find_all("measure")])
+    return dict(uid=unit_tag["id"], measure=measure)
 
 
 def retrieve_tags(xml_soup):
@@ -64,7 +122,7 @@ def retrieve_tags(xml_soup):
     link_tags = [tag for tag in all_tags if tag.name == "schemaRef"]
 
     if len(all_tags) - ( len(context_tags) + len(fact_tags) + len(unit_tags) + len(link_tags) ) != 0:
-        print("Script may have additional tags outside of Link, Context, Unit, and Fact tags.")
+        logger.warning("Script may have additional tags outside of Link, Context, Unit, and Fact tags.")
 
     return dict(context_tags=context_tags, fact_tags=fact_tags, unit_tags=unit_tags, link_tags=link_tags)
 
@@ -72,23 +130,278 @@ def retrieve_tags(xml_soup):
 def merge_facts_and_context(tag_dictionary):
     """
     Purpose: Merge the facts and context tags such that each fact will now include the dimensions and dates.
-    Inputs: a dictionary containing fact_tags and context_tags.
-    Output: a dataframe where each row is a concept with the following attributes: name, value, date, dimensions (and columns to identify which report it came from).
+    Inputs: a dictionary containing fact_tags, context_tags, unit_tags and link_tags.
+    Output: (numeric facts, text facts) dataframes where each row is a concept with the following attributes: name, value, date, dimensions (and columns to identify which report it came from).
+    See facts_frames_from_buffers for the column types.
     """
-    context_df = pd.DataFrame(map(extract_context_tag_info, tag_dictionary["context_tags"]))
-    fact_tag_details = [dict(name=tag.name, context=tag["contextRef"], value=tag.text) for tag in tag_dictionary["fact_tags"]]
-    facts_df = pd.DataFrame(fact_tag_details)
-    facts_df = facts_df.merge(context_df, left_on="context", right_on="uid", how="left").drop(columns="uid")
+    buffers = InstanceBuffers()
+    for context_tag in tag_dictionary["context_tags"]:
+        buffers.add_context(**extract_context_tag_info(context_tag))
+    for unit_tag in tag_dictionary["unit_tags"]:
+        buffers.add_unit(**extract_unit_tag_info(unit_tag))
+    for tag in tag_dictionary["fact_tags"]:
+        buffers.add_fact(tag.name, tag["contextRef"], tag.text, tag.get("unitRef"), tag.get("decimals"))
+    buffers.schema_ref = tag_dictionary["link_tags"][0].get('xlink:href')
+    return facts_frames_from_buffers(buffers)
+
 
-    facts_df.loc[:, "Quarter"] = facts_df.query("name == 'DocumentFiscalPeriodFocus' ").value.squeeze()
-    facts_df.loc[:, "Year"] = facts_df.query("name == 'DocumentFiscalYearFocus' ").value.squeeze()
-    facts_df.loc[:, "Amended"] = facts_df.query("name == 'AmendmentFlag' ").value.squeeze()
+# Filing columns and the DEI facts they are read from
+DEI_FILING_COLUMNS = dict(Quarter="DocumentFiscalPeriodFocus", Year="DocumentFiscalYearFocus", Amended="AmendmentFlag")
+DEI_FILING_NAMES = frozenset(DEI_FILING_COLUMNS.values())
 
-    facts_df.loc[:, "Ticker"] = tag_dictionary["link_tags"][0].get('xlink:href').split("-")[0].upper()
+
+def add_filing_columns(facts_df, schema_ref, dei):
+    """
+    Purpose: Stamp every fact with the fiscal period, amendment flag and ticker of the filing it came from.
+    Inputs: facts dataframe, the href of the filing's schemaRef (e.g. sq-20210630.xsd) and the DEI values captured while parsing (InstanceBuffers.dei).
+    Output: facts dataframe with Quarter, Year, Amended and Ticker columns.
+    """
+    for column, name in DEI_FILING_COLUMNS.items():
+        facts_df[column] = constant_categorical(dei.get(name), len(facts_df))
+
+    facts_df["Ticker"] = constant_categorical(schema_ref.split("-")[0].upper(), len(facts_df))
 
     return facts_df
 
 
+def constant_categorical(value, length):
+    if value is None:
+        return pd.Categorical.from_codes(np.full(length, -1, dtype="int8"), categories=pd.Index([], dtype=object))
+    return pd.Categorical.from_codes(np.zeros(length, dtype="int8"), categories=[value])
+
+
+def intern(codes, key):
+    # The integer code of key, assigning the next one the first time key is seen.
+    code = codes.get(key)
+    if code is None:
+        code = codes[key] = len(codes)
+    return code
+
+
+class InstanceBuffers:
+
+    """
+    Instance Buffers Class\n
+    Column buffers for one XBRL instance document, filled by either parser. Context and unit ids, periods, dimension strings, measures and
+    concept names are interned into integer codes the first time they are seen, so a fact only stores codes plus its value and decimals,
+    and facts_frames_from_buffers joins contexts and units by array lookup. Periods are shared by many contexts, so their labels and dates are
+    formatted once per period. The DEI facts that label the filing (see DEI_FILING_COLUMNS) are captured as they are read.
+
+    Use:\n
+    buffers = InstanceBuffers()
+    buffers.add_context("c1", instant="2021-06-30")
+    buffers.add_unit("usd", "iso4217:USD")
+    buffers.add_fact("Assets", "c1", "5727960000", unit_ref="usd", decimals="-3")
+    facts_df, text_facts_df = facts_frames_from_buffers(buffers)
+    """
+
+    def __init__(self):
+        self.context_codes, self.period_codes, self.dimension_codes = dict(), dict(), dict()
+        self.unit_codes, self.measure_codes, self.name_codes = dict(), dict(), dict()
+        # Indexed by context / period / unit code; -1 marks an id that facts referenced but the document never defined.
+        self.contexts = dict(period=list(), dimensions=list())
+        self.periods = dict(date=list(), start=list(), end=list(), instant=list())
+        self.units = dict(measure=list())
+        self.facts = dict(name=list(), context=list(), value=list(), unit=list(), decimals=list())
+        self.dei = dict()
+        self.schema_ref = None
+
+
+    def context_code(self, uid):
+        code = intern(self.context_codes, uid)
+        if code == len(self.contexts["period"]):
+            self.contexts["period"].append(-1)
+            self.contexts["dimensions"].append(-1)
+        return code
+
+
+    def unit_code(self, uid):
+        code = intern(self.unit_codes, uid)
+        if code == len(self.units["measure"]):
+            self.units["measure"].append(-1)
+        return code
+
+
+    def add_context(self, uid, start=None, end=None, instant=None, dimensions=""):
+        code = self.context_code(uid)
+        period = (start, end, instant)
+        period_code = self.period_codes.get(period)
+        if period_code is None:
+            period_code = self.period_codes[period] = len(self.periods["date"])
+            if instant is not None:
+                self.periods["date"].append(format_context_date(instant=instant.strip()))
+            else:
+                self.periods["date"].append(format_context_date(start_date=start.strip(), end_date=end.strip()))
+            self.periods["start"].append(start)
+            self.periods["end"].append(end)
+            self.periods["instant"].append(instant)
+        self.contexts["period"][code] = period_code
+        self.contexts["dimensions"][code] = intern(self.dimension_codes, dimensions)
+
+
+    def add_unit(self, uid, measure):
+        self.units["measure"][self.unit_code(uid)] = intern(self.measure_codes, measure)
+
+
+    def add_fact(self, name, context_ref, value, unit_ref=None, decimals=None):
+        if name in DEI_FILING_NAMES and name not in self.dei:
+            self.dei[name] = value
+        # Plain lookups first: nearly every fact reuses a name, context and unit that is already interned.
+        name_code = self.name_codes.get(name)
+        context_code = self.context_codes.get(context_ref)
+        unit_code = -1 if unit_ref is None else self.unit_codes.get(unit_ref)
+        facts = self.facts
+        facts["name"].append(intern(self.name_codes, name) if name_code is None else name_code)
+        facts["context"].append(self.context_code(context_ref) if context_code is None else context_code)
+        facts["value"].append(value)
+        facts["unit"].append(self.unit_code(unit_ref) if unit_code is None else unit_code)
+        facts["decimals"].append(decimals)
+
+
+def iterparse_instance(instance_xml):
+    """
+    Purpose: Streaming alternative to parse_xml_tree + retrieve_tags. Walks the instance with lxml iterparse and adds each top level
+    context, unit and fact straight to the column buffers, clearing every element once it has been read, so the full tree is never held in memory.
+    Inputs: XBRL instance document (bytes or str).
+    Output: InstanceBuffers.
+    """
+    if isinstance(instance_xml, str):
+        instance_xml = instance_xml.encode("utf-8")
+
+    buffers = InstanceBuffers()
+    add_fact = buffers.add_fact
+
+    events = etree.iterparse(io.BytesIO(instance_xml), events=("start", "end"), huge_tree=True, remove_comments=True)
+    _, root = next(events)
+    for event, element in events:
+        if event != "end" or element.getparent() is not root:
+            continue
+
+        local_name = etree.QName(element).localname
+        context_ref = element.get("contextRef")
+        if context_ref is not None:
+            add_fact(local_name, context_ref, "".join(element.itertext()), element.get("unitRef"), element.get("decimals"))
+        elif local_name == "context":
+            instant = element.find(".//{*}instant")
+            if instant is not None:
+                start, end, instant = None, None, instant.text
+            else:
+                start, end = element.find(".//{*}startDate").text, element.find(".//{*}endDate").text
+            dimensions = "\n".join(f"{member.get('dimension')} [{member.text}]" for member in element.iterfind(".//{*}explicitMember"))
+            buffers.add_context(element.get("id"), start, end, instant, dimensions)
+        elif local_name == "unit":
+            numerator = element.find(".//{*}unitNumerator")
+            if numerator is not None:
+                measure = format_unit_measure(
+                    [measure.text for measure in numerator.iterfind("{*}measure")],
+                    [measure.text for measure in element.iterfind(".//{*}unitDenominator/{*}measure")],
+                )
+            else:
+                measure = format_unit_measure([measure.text for measure in element.iterfind("{*}measure")])
+            buffers.add_unit(element.get("id"), measure)
+        elif local_name == "schemaRef" and buffers.schema_ref is None:
+            buffers.schema_ref = element.get(XLINK_HREF)
+
+        element.clear()
+        while element.getprevious() is not None:
+            del root[0]
+
+    return buffers
+
+
+FACT_CATEGORY_COLUMNS = ["name", "context", "unit", "date", "dimensions", "Quarter", "Year", "Amended", "Ticker"]
+FACT_DATE_COLUMNS = ["start", "end", "instant"]
+
+
+def coded_categorical(codes, interned):
+    """
+    Purpose: Build a categorical straight from interned codes, with the categories sorted as astype("category") would sort them.
+    Inputs: integer codes (-1 for missing) and the dictionary of value to code they were interned with.
+    Output: pandas Categorical.
+    """
+    categories = np.array(list(interned), dtype=object)
+    order = np.argsort(categories, kind="stable")
+    sorted_codes = np.empty(len(order) + 1, dtype="int64")
+    sorted_codes[order] = np.arange(len(order))
+    sorted_codes[-1] = -1
+    return pd.Categorical.from_codes(sorted_codes[codes], categories=categories[order])
+
+
+def facts_frames_from_buffers(buffers):
+    """
+    Purpose: Build typed facts dataframes from the InstanceBuffers of iterparse_instance (or merge_facts_and_context). Facts with a unitRef
+    are numeric: value is float64 exactly as reported (XBRL values are never scaled; decimals only records their precision, with INF as inf)
+    and unit is the resolved measure, e.g. iso4217:USD or iso4217:USD/xbrli:shares. Everything else (text blocks, dei strings) goes to the text table.
+    Labels are categorical and start / end / instant are datetime64; date keeps the "MM/DD/YYYY to MM/DD/YYYY" label for display.
+    Contexts and units are joined by indexing their code arrays with the facts' codes.
+    Inputs: InstanceBuffers.
+    Output: (numeric facts dataframe, text facts dataframe).
+    """
+    # A unit that facts reference but the document never defines keeps its id as the measure.
+    for uid, unit_code in buffers.unit_codes.items():
+        if buffers.units["measure"][unit_code] == -1:
+            buffers.units["measure"][unit_code] = intern(buffers.measure_codes, uid)
+
+    fact_contexts = np.asarray(buffers.facts["context"], dtype="int64")
+    fact_units = np.asarray(buffers.facts["unit"], dtype="int64")
+    context_periods = np.append(np.asarray(buffers.contexts["period"], dtype="int64"), -1)[fact_contexts]
+    unit_measures = np.append(np.asarray(buffers.units["measure"], dtype="int64"), -1)[fact_units]
+
+    columns = dict(
+        name=coded_categorical(np.asarray(buffers.facts["name"], dtype="int64"), buffers.name_codes),
+        context=coded_categorical(fact_contexts, buffers.context_codes),
+        value=np.asarray(buffers.facts["value"], dtype=object),
+        unit=coded_categorical(unit_measures, buffers.measure_codes),
+        decimals=np.asarray(buffers.facts["decimals"], dtype=object),
+        date=coded_categorical(context_periods, {date: code for code, date in enumerate(buffers.periods["date"])}),
+    )
+    for column in FACT_DATE_COLUMNS:
+        period_dates = pd.to_datetime(pd.Series(buffers.periods[column], dtype=object).str.strip(), format="%Y-%m-%d", errors="coerce")
+        columns[column] = np.append(period_dates.to_numpy(dtype="datetime64[ns]"), np.datetime64("NaT", "ns"))[context_periods]
+    columns["dimensions"] = coded_categorical(np.append(np.asarray(buffers.contexts["dimensions"], dtype="int64"), -1)[fact_contexts], buffers.dimension_codes)
+    facts_df = pd.DataFrame(columns)
+
+    is_numeric = fact_units >= 0
+    text_facts_df = facts_df.loc[~is_numeric].drop(columns=["unit", "decimals"]).reset_index(drop=True)
+    facts_df = facts_df.loc[is_numeric].reset_index(drop=True)
+    facts_df["value"] = pd.to_numeric(facts_df["value"].str.strip(), errors="coerce").astype("float64")
+    facts_df["decimals"] = pd.to_numeric(facts_df["decimals"], errors="coerce").astype("float64")
+
+    frames = list()
+    for frame in (facts_df, text_facts_df):
+        for column in frame.select_dtypes("category").columns:
+            frame[column] = frame[column].cat.remove_unused_categories()
+        frames.append(add_filing_columns(frame, buffers.schema_ref, buffers.dei))
+    return tuple(frames)
+
+
+def categorize_fact_columns(facts_df):
+    for column in FACT_CATEGORY_COLUMNS:
+        if column in facts_df.columns:
+            facts_df[column] = facts_df[column].astype("category")
+    return facts_df
+
+
+def concat_facts(facts_frames):
+    """
+    Purpose: Concatenate facts dataframes from several filings. pd.concat falls back to object dtype when categories differ, so the
+    categories of each label column are unioned first.
+    Inputs: list of facts dataframes.
+    Output: one facts dataframe with a fresh index.
+    """
+    facts_frames = [facts_df for facts_df in facts_frames if facts_df is not None and len(facts_df.columns)]
+    if not facts_frames:
+        return pd.DataFrame()
+    for column in FACT_CATEGORY_COLUMNS:
+        if all(column in facts_df.columns and isinstance(facts_df[column].dtype, pd.CategoricalDtype) for facts_df in facts_frames):
+            categories = union_categoricals([facts_df[column] for facts_df in facts_frames], sort_categories=True).categories
+            facts_frames = [facts_df.assign(**{column: facts_df[column].cat.set_categories(categories)}) for facts_df in facts_frames]
+    return pd.concat(facts_frames, ignore_index=True)
+
+
+MISMATCH_KEY_COLUMNS = ["name", "dimensions", "date"]
+
+
 def check_for_mismatches(complete_df):
     """
     Purpose: This is primarily to help check for small presentation differences between periods. For example, if a concept was reported rounded to zero decimals in the prior year but 
@@ -102,6 +415,342 @@ def check_for_mismatches(complete_df):
     return mismatch_df
 
 
+COMPARE_KEY_COLUMNS = ["name", "dimensions", "date"]
+COMPARE_COLUMNS = COMPARE_KEY_COLUMNS + ["value", "end", "instant", "Quarter", "Year", "Amended", "Ticker"]
+FISCAL_PERIOD_ORDER = dict(Q1=1, Q2=2, Q3=3, Q4=4, FY=4)
+
+
+def label_codes(column):
+    # Integer codes for a label column, 0 for missing, so they can be combined arithmetically; categorical columns reuse their codes.
+    if not isinstance(column.dtype, pd.CategoricalDtype):
+        column = column.astype("category")
+    return column.cat.codes.to_numpy().astype("int64") + 1, column.cat.categories
+
+
+def period_mask(facts_df, periods):
+    """
+    Purpose: Select facts by period. Strings are matched against the date label ("06/30/2021" or "01/01/2021 to 06/30/2021"), anything
+    else (Timestamps, dates) against the period end, i.e. the instant or the end of the duration.
+    Inputs: facts dataframe and a list of periods.
+    Output: boolean Series.
+    """
+    labels = [period for period in periods if isinstance(period, str)]
+    period_ends = pd.to_datetime([period for period in periods if not isinstance(period, str)])
+    mask = facts_df["date"].isin(labels)
+    if len(period_ends):
+        mask |= facts_df["instant"].fillna(facts_df["end"]).isin(period_ends)
+    return mask
+
+
+def filing_rank(facts_df):
+    # Orders the filings a fact came from: fiscal year, then fiscal period, then amendments after the original filing.
+    rank = np.zeros(len(facts_df))
+    if "Year" in facts_df.columns:
+        rank += pd.to_numeric(facts_df["Year"].astype(object), errors="coerce").fillna(0).to_numpy() * 10
+    if "Quarter" in facts_df.columns:
+        rank += facts_df["Quarter"].astype(object).map(FISCAL_PERIOD_ORDER).fillna(0).to_numpy(dtype="float64")
+    if "Amended" in facts_df.columns:
+        rank += (facts_df["Amended"].astype(object).astype(str).str.lower() == "true").to_numpy() * 0.5
+    return rank
+
+
+def compare_facts(facts_df, concepts=None, periods=None, keep="latest"):
+    """
+    Purpose: Pivot facts from several companies side by side: one row per concept, dimensions and date, one column per ticker. Filters are
+    applied before pivoting and the pivot is built from integer codes of the label columns, so it stays cheap for dozens of peers and long
+    filing histories. A fact reported in several filings of one company (comparative periods, restatements) is taken from the latest filing
+    (fiscal year, period, then amendments, then the order the facts were added); keep="earliest" takes the originally reported value instead.
+    Facts without a Ticker cannot be attributed to a company and are dropped.
+    Inputs: facts dataframe (e.g. XBRLReport.facts_df or FactStore.query), optionally concept names, periods (see period_mask) and keep.
+    Output: dataframe indexed by (name, dimensions, date) with one float64 column per ticker, NaN where a company does not report the fact.
+    """
+    if keep not in ("latest", "earliest"):
+        raise ValueError(f"keep must be 'latest' or 'earliest', not {keep!r}")
+    if concepts is not None:
+        facts_df = facts_df[facts_df["name"].isin(concepts)]
+    if periods is not None:
+        facts_df = facts_df[period_mask(facts_df, periods)]
+    facts_df = facts_df[facts_df["Ticker"].notna()]
+
+    key_codes = [label_codes(facts_df[column]) for column in COMPARE_KEY_COLUMNS]
+    ticker_codes, tickers = label_codes(facts_df["Ticker"])
+    row_keys = np.ravel_multi_index([codes for codes, _ in key_codes], [len(categories) + 1 for _, categories in key_codes]) if len(facts_df) else np.zeros(0, dtype="int64")
+    row_ids, unique_row_keys = pd.factorize(row_keys, sort=True)
+    column_ids, unique_ticker_codes = pd.factorize(ticker_codes, sort=True)
+
+    # Sort by cell, then by filing rank and position; the last (or first) fact of every cell wins.
+    cells = row_ids.astype("int64") * max(len(unique_ticker_codes), 1) + column_ids
+    rank = filing_rank(facts_df) if keep == "latest" else -filing_rank(facts_df)
+    position = np.arange(len(facts_df)) if keep == "latest" else -np.arange(len(facts_df))
+    order = np.lexsort((position, rank, cells))
+    winners = order[np.append(cells[order][1:] != cells[order][:-1], True)] if len(order) else order
+
+    matrix = np.full((len(unique_row_keys), len(unique_ticker_codes)), np.nan)
+    matrix[row_ids[winners], column_ids[winners]] = facts_df["value"].to_numpy(dtype="float64")[winners]
+
+    key_arrays = np.unravel_index(unique_row_keys, [len(categories) + 1 for _, categories in key_codes])
+    index = pd.MultiIndex.from_arrays(
+        [pd.Categorical.from_codes(codes - 1, categories) for codes, (_, categories) in zip(key_arrays, key_codes)], names=COMPARE_KEY_COLUMNS
+    )
+    columns = pd.Index(tickers.take(unique_ticker_codes - 1), name="Ticker")
+    return pd.DataFrame(matrix, index=index, columns=columns)
+
+
+class SortedInterner:
+
+    """
+    Sorted Interner Class\n
+    Gives values stable integer codes in order of first appearance, like intern() but for a whole array at once. The values seen so far are
+    kept sorted next to their codes, so interning a chunk is a unique, a searchsorted and an insert, without a Python loop over the values
+    or a hash table rebuilt over everything seen. Used by FactAccumulator to key its counts by dense integer ids.
+
+    Use:\n
+    interner = SortedInterner()
+    interner.codes(np.array([7, 3, 7]))    # [0, 1, 0]
+    interner.values[1]                     # 3
+    """
+
+    def __init__(self, dtype="int64"):
+        self.values = np.zeros(0, dtype=dtype)
+        self.sorted_values = np.zeros(0, dtype=dtype)
+        self.sorted_codes = np.zeros(0, dtype="int64")
+
+
+    def codes(self, values):
+        inverse, uniques = pd.factorize(values)
+        order = np.argsort(uniques, kind="stable")
+        uniques, inverse = uniques[order], np.argsort(order)[inverse]
+        positions = np.searchsorted(self.sorted_values, uniques)
+        found = positions < len(self.sorted_values)
+        found[found] = self.sorted_values[positions[found]] == uniques[found]
+        unique_codes = np.empty(len(uniques), dtype="int64")
+        unique_codes[found] = self.sorted_codes[positions[found]]
+        unique_codes[~found] = np.arange(len(self.values), len(self.values) + int((~found).sum()))
+
+        self.sorted_values = np.insert(self.sorted_values, positions[~found], uniques[~found])
+        self.sorted_codes = np.insert(self.sorted_codes, positions[~found], unique_codes[~found])
+        self.values = np.concatenate([self.values, uniques[~found]])
+        return unique_codes[inverse]
+
+
+class FactAccumulator:
+
+    """
+    Fact Accumulator Class\n
+    Collects one facts dataframe per filing without re-copying everything already collected: chunks are only concatenated when the frame
+    is read, and the result is kept until the next append. When track_mismatches is set it also keeps, for every (name, dimensions, date)
+    key, how often each value was reported and how many of its values were reported exactly once, as numpy arrays indexed by integer ids
+    (see SortedInterner). mismatches() counts the rows appended since it was last called, updates only the keys whose counts change and
+    filters the frame with the counts instead of recomputing duplicates over it. Its first call is a plain check_for_mismatches, as counting
+    only pays off when mismatches are checked again after more appends.
+
+    With a memory_budget (bytes) the chunks held in RAM are written to Parquet files in spill_directory (a temporary directory by
+    default, removed with the accumulator) whenever they outgrow the budget. The key index is not kept in that mode, as it grows with
+    the facts; mismatches() and select() then read the spilled chunks back one group of concepts at a time instead.
+
+    Use:\n
+    accumulator = FactAccumulator()
+    accumulator.append(facts_df)
+    accumulator.frame
+
+    accumulator = FactAccumulator(memory_budget=512 * 1024 ** 2)
+    """
+
+    def __init__(self, track_mismatches=True, memory_budget=None, spill_directory=None):
+        self.track_mismatches = track_mismatches and memory_budget is None
+        self.memory_budget = memory_budget
+        self.spill_directory = spill_directory
+        self.chunks = list()
+        self.chunk_bytes = 0
+        self.spilled = list()
+        self._spill_directory = None
+        self.label_interners = {column: SortedInterner(dtype=object) for column in MISMATCH_KEY_COLUMNS}
+        self.key_interners = [SortedInterner(), SortedInterner()]
+        self.value_interner, self.pair_interner = SortedInterner(), SortedInterner()
+        self.checked, self.counted_rows, self.row_pairs = False, 0, list()
+        self.pair_keys = np.zeros(0, dtype="int64")
+        self.value_counts = np.zeros(0, dtype="int64")
+        self.single_counts = np.zeros(0, dtype="int64")
+
+
+    @property
+    def frame(self):
+        # All facts as one dataframe. Spilled chunks are all read back into RAM for it; iter_chunks() and select() stay within the budget.
+        if self.spilled:
+            return concat_facts(list(self.iter_chunks()))
+        if len(self.chunks) != 1:
+            self.chunks = [concat_facts(self.chunks)]
+        return self.chunks[0]
+
+
+    def append(self, facts_df):
+        """
+        Purpose: Add one filing's facts. With track_mismatches their values are counted the next time mismatches() is called, in one pass
+        over all the filings appended since.
+        Inputs: facts dataframe.
+        Output: None.
+        """
+        self.chunks.append(facts_df)
+        if self.memory_budget is not None:
+            self.chunk_bytes += int(facts_df.memory_usage(deep=True).sum())
+            if self.chunk_bytes > self.memory_budget:
+                self.spill()
+
+
+    def count_values(self):
+        """
+        Purpose: Bring the value counts up to date with the filings appended since the last call. Same rule as check_for_mismatches: values
+        reported more than once agree with each other and are dropped, and a key is a mismatch when at least two rows remain. So every key
+        counts its values that were reported exactly once, and only the keys whose value counts change are updated.
+        Inputs: None.
+        Output: None.
+        """
+        uncounted = list(self.uncounted_frames())
+        if not uncounted:
+            return
+        key_ids = self.key_ids(uncounted)
+        values = np.concatenate([facts_df["value"].to_numpy(dtype="float64") for facts_df in uncounted]) + 0.0    # -0.0 becomes 0.0
+        value_ids = self.value_interner.codes(np.where(np.isnan(values), np.nan, values).view("int64"))
+        row_pairs = self.pair_interner.codes(key_ids << 31 | value_ids)
+        self.row_pairs.append(row_pairs)
+        self.counted_rows += len(row_pairs)
+
+        new_pairs = self.pair_interner.values[len(self.pair_keys):]
+        self.pair_keys = np.concatenate([self.pair_keys, new_pairs >> 31])
+        self.value_counts = np.concatenate([self.value_counts, np.zeros(len(new_pairs), dtype="int64")])
+        self.single_counts = np.concatenate([self.single_counts, np.zeros(len(self.key_interners[1].values) - len(self.single_counts), dtype="int64")])
+
+        pair_counts = np.bincount(row_pairs, minlength=len(self.value_counts))
+        pair_ids = np.flatnonzero(pair_counts)
+        pair_counts = pair_counts[pair_ids]
+        previous_counts = self.value_counts[pair_ids]
+        self.value_counts[pair_ids] += pair_counts
+        single_changes = (previous_counts + pair_counts == 1).astype("int64") - (previous_counts == 1)
+        self.single_counts += np.bincount(self.pair_keys[pair_ids], weights=single_changes, minlength=len(self.single_counts)).astype("int64")
+
+
+    def uncounted_frames(self):
+        # The rows appended since the last count_values, as slices of the chunks (which may have been concatenated in the meantime)
+        first_row = 0
+        for chunk in self.chunks:
+            if first_row + len(chunk) > self.counted_rows:
+                yield chunk.iloc[max(self.counted_rows - first_row, 0):]
+            first_row += len(chunk)
+
+
+    def key_ids(self, facts_frames):
+        # Dense ids of the (name, dimensions, date) keys: label ids (0 for missing) are paired up two at a time and interned again.
+        label_ids = list()
+        for column in MISMATCH_KEY_COLUMNS:
+            column_ids = list()
+            for facts_df in facts_frames:
+                codes, categories = label_codes(facts_df[column])
+                category_ids = self.label_interners[column].codes(categories.to_numpy(dtype=object)) + 1
+                column_ids.append(np.concatenate([[0], category_ids])[codes])
+            label_ids.append(np.concatenate(column_ids))
+        name_dimension_ids = self.key_interners[0].codes(label_ids[0] << 31 | label_ids[1])
+        return self.key_interners[1].codes(name_dimension_ids << 31 | label_ids[2])
+
+
+    @property
+    def mismatched_keys(self):
+        # (name, dimensions, date) MultiIndex of the keys with at least two values that were each reported once
+        self.count_values()
+        key_ids = np.flatnonzero(self.single_counts >= 2)
+        packed = self.key_interners[1].values[key_ids]
+        name_dimension = self.key_interners[0].values[packed >> 31]
+        label_ids = [name_dimension >> 31, name_dimension & (2 ** 31 - 1), packed & (2 ** 31 - 1)]
+        labels = [np.concatenate([[None], self.label_interners[column].values])[ids] for column, ids in zip(MISMATCH_KEY_COLUMNS, label_ids)]
+        return pd.MultiIndex.from_arrays(labels, names=MISMATCH_KEY_COLUMNS)
+
+
+    def spill(self):
+        """
+        Purpose: Write the chunks held in RAM to one Parquet file and drop them from memory.
+        Inputs: None.
+        Output: None.
+        """
+        chunks = [chunk for chunk in self.chunks if len(chunk.columns)]
+        if chunks:
+            if self._spill_directory is None:
+                self._spill_directory = tempfile.TemporaryDirectory(prefix="facts-", dir=self.spill_directory)
+            frame = concat_facts(chunks)
+            # The row position is stored as the index so rows read back through filters keep their place in the full frame.
+            first_row = sum(spilled["rows"] for spilled in self.spilled)
+            frame.index = pd.Index(np.arange(first_row, first_row + len(frame)))
+            path = os.path.join(self._spill_directory.name, f"chunk-{len(self.spilled):05d}.parquet")
+            frame.to_parquet(path)
+            self.spilled.append(dict(path=path, rows=len(frame), bytes=self.chunk_bytes, columns=list(frame.columns)))
+            instrumentation.count("spilled_facts", len(frame))
+        self.chunks = list()
+        self.chunk_bytes = 0
+
+
+    def iter_chunks(self, names=None, columns=None):
+        """
+        Purpose: Read the facts back chunk by chunk, spilled ones first, keeping only the given concepts and columns.
+        Inputs: optionally concept names and columns.
+        Output: generator of facts dataframes indexed by their row position in the full frame.
+        """
+        first_row = 0
+        for spilled in self.spilled:
+            chunk_columns = None if columns is None else [column for column in columns if column in spilled["columns"]]
+            filters = None if names is None else [("name", "in", list(names))]
+            yield pd.read_parquet(spilled["path"], columns=chunk_columns, filters=filters)
+            first_row += spilled["rows"]
+        for chunk in self.chunks:
+            if not len(chunk.columns):
+                continue
+            chunk = chunk.set_axis(pd.RangeIndex(first_row, first_row + len(chunk)))
+            first_row += len(chunk)
+            if names is not None:
+                chunk = chunk[chunk["name"].isin(names)]
+            yield chunk if columns is None else chunk[[column for column in columns if column in chunk.columns]]
+
+
+    def select(self, names=None, columns=None):
+        frames = list(self.iter_chunks(names, columns))
+        facts_df = concat_facts(frames)
+        if frames:
+            facts_df.index = np.concatenate([frame.index.to_numpy() for frame in frames if len(frame.columns)])
+        return facts_df
+
+
+    def concept_groups(self):
+        """
+        Purpose: Split the concepts into groups whose facts fit the memory budget together, for out-of-core group operations.
+        Inputs: None.
+        Output: list of lists of concept names.
+        """
+        name_counts = pd.concat([frame["name"].astype(object).value_counts() for frame in self.iter_chunks(columns=["name"])]).groupby(level=0).sum()
+        total_bytes = sum(spilled["bytes"] for spilled in self.spilled) + self.chunk_bytes
+        groups = max(1, -(-total_bytes // self.memory_budget)) if self.memory_budget else 1
+        group_numbers = (name_counts.cumsum() - 1) * groups // max(name_counts.sum(), 1)
+        return [list(names) for _, names in name_counts.index.to_series().groupby(group_numbers.to_numpy())]
+
+
+    def mismatches(self):
+        if not self.track_mismatches and self.spilled:
+            # Facts of different concepts never mismatch, so the check runs over one group of concepts at a time.
+            mismatch_frames = [check_for_mismatches(self.select(names=names)) for names in self.concept_groups()]
+            mismatch_df = concat_facts(mismatch_frames)
+            if len(mismatch_df):
+                mismatch_df.index = np.concatenate([frame.index.to_numpy() for frame in mismatch_frames if len(frame.columns)])
+            return mismatch_df
+        if not self.track_mismatches or not self.checked:
+            # Counting values only pays off when mismatches are checked again after more appends, so the first check is a plain one.
+            self.checked = self.track_mismatches
+            return check_for_mismatches(self.frame)
+        # A row is a mismatch when its value was reported once and its key has another value reported once.
+        self.count_values()
+        frame = self.frame
+        if not self.row_pairs:
+            return frame.iloc[0:0]
+        row_pairs = np.concatenate(self.row_pairs)
+        is_mismatch = (self.value_counts[row_pairs] == 1) & (self.single_counts[self.pair_keys[row_pairs]] >= 2)
+        return check_for_mismatches(frame[is_mismatch])
+
+
 class XBRLReport:
 
     """
@@ -111,29 +760,129 @@ class XBRLReport:
     Use:\n
     report = XBRL.XBRLReport(filing_url)
     report.load_first_report()
+
+    Pass session=EdgarSession(...) to share one rate-limited connection pool between reports.
+    facts_df holds the numeric facts (typed, see facts_frames_from_buffers) and text_facts_df the text facts.
+    report.compare() puts the facts of every company in the report side by side (see compare_facts).
+    Instances are read with the streaming parser; parser="soup" uses the original BeautifulSoup parser for comparison. Parsed tags are
+    not kept once their facts are extracted.
+    memory_budget (bytes, shared by the numeric and text facts) bounds the facts held in RAM; beyond it they are spilled to Parquet
+    chunks in spill_directory (see FactAccumulator), and mismatches() and compare() read them back a group of concepts at a time.
+    facts_df and text_facts_df still load every spilled chunk back into RAM; use facts_accumulator.iter_chunks() or select() to stay
+    within the budget.
     """
 
-    def __init__(self, filing_url):
+    def __init__(self, filing_url=None, session=None, parser="stream", memory_budget=None, spill_directory=None):
+        self.session = session
+        self.parser = parser
+        self.memory_budget = memory_budget
+        self.spill_directory = spill_directory
         self.initial_filing_url = filing_url
         self.all_links = list()
-        self.load_first_report()
+        self.facts_accumulator = self.new_accumulator()
+        self.text_facts_accumulator = self.new_accumulator(track_mismatches=False)
+        if filing_url is not None:
+            self.load_first_report()
+
+
+    @classmethod
+    def from_urls(cls, filing_urls, session=None, max_workers=10, parse_workers=None, parser="stream", memory_budget=None, spill_directory=None):
+        """
+        Purpose: Build one report from many filings. Instance documents are fetched concurrently through the shared session and parsed on a
+        process pool; a filing that fails to download or parse is reported instead of aborting the batch. Each filing's facts are added as
+        soon as every filing before it is done. With a memory_budget at most two filings per fetch thread are downloaded, parsed or waiting
+        for an earlier filing at a time.
+        Inputs: Edgar Filing URLs, optionally an EdgarSession, the number of fetch threads and parse processes (0 parses on the fetch threads),
+        the parser, the memory budget in bytes and the spill directory.
+        Output: (XBRLReport, dictionary of filing url to the exception that stopped it). Facts are kept in the order of filing_urls.
+        """
+        filing_urls = list(dict.fromkeys(filing_urls))
+        report = cls(session=session, parser=parser, memory_budget=memory_budget, spill_directory=spill_directory)
+        errors = dict()
+        parse = functools.partial(facts_from_instance, parser=parser)
+        max_pending = 2 * max_workers if memory_budget is not None else None
+        # Results come back in the order of filing_urls; the ones that finish early count towards max_pending while they wait.
+        for batch_result in run_batch(filing_urls, fetch_instance, parse, session, max_workers, parse_workers, max_pending=max_pending, ordered=True):
+            if batch_result.error is not None:
+                errors[batch_result.url] = batch_result.error
+                continue
+            report.all_links.append(batch_result.url)
+            report.facts_accumulator.append(batch_result.result[0])
+            report.text_facts_accumulator.append(batch_result.result[1])
+
+        report.initial_filing_url = report.all_links[0] if report.all_links else None
+        return report, errors
+
+
+    @classmethod
+    def from_store(cls, store, **filters):
+        """
+        Purpose: Build a report from a local FactStore instead of the network.
+        Inputs: factstore.FactStore and the FactStore.query filters (concepts, tickers, years, quarters, dates, period_start, period_end).
+        Output: XBRLReport.
+        """
+        report = cls()
+        report.facts_df = store.query(**filters)
+        report.text_facts_df = store.query(text=True, **filters)
+        return report
+
+
+    def to_store(self, store):
+        return store.write(self.facts_df, self.text_facts_df)
+
+
+    @property
+    def facts_df(self):
+        return self.facts_accumulator.frame
+
+
+    @facts_df.setter
+    def facts_df(self, facts_df):
+        self.facts_accumulator = self.new_accumulator()
+        self.facts_accumulator.append(facts_df)
+
+
+    @property
+    def text_facts_df(self):
+        return self.text_facts_accumulator.frame
+
+
+    @text_facts_df.setter
+    def text_facts_df(self, text_facts_df):
+        self.text_facts_accumulator = self.new_accumulator(track_mismatches=False)
+        self.text_facts_accumulator.append(text_facts_df)
+
+
+    def new_accumulator(self, track_mismatches=True):
+        memory_budget = self.memory_budget // 2 if self.memory_budget is not None else None
+        return FactAccumulator(track_mismatches=track_mismatches, memory_budget=memory_budget, spill_directory=self.spill_directory)
 
 
     def load_first_report(self):
         self.all_links.append(self.initial_filing_url)
-        soup = parse_xml_tree(self.initial_filing_url)
-        self.tag_dictionary = retrieve_tags(soup)
-        self.facts_df = merge_facts_and_context(self.tag_dictionary)
-        print("Initial report successfully loaded!")
+        self.facts_df, self.text_facts_df = self.load_facts(self.initial_filing_url)
+        logger.info("Initial report successfully loaded!")
+
+
+    def load_facts(self, filing_url):
+        if self.parser == "soup":
+            return merge_facts_and_context( retrieve_tags( parse_xml_tree(filing_url, session=self.session) ) )
+        return facts_from_instance(fetch_instance(filing_url, session=self.session), parser=self.parser)
 
 
     def append_report(self, additional_filing_link):
         self.all_links.append(additional_filing_link)
-        soup = parse_xml_tree(additional_filing_link)
-        additional_facts_df = merge_facts_and_context( retrieve_tags(soup) )
-        self.facts_df = pd.concat( [self.facts_df, additional_facts_df] )
-        print("Additional report successfully appended!")
+        additional_facts_df, additional_text_facts_df = self.load_facts(additional_filing_link)
+        self.facts_accumulator.append(additional_facts_df)
+        self.text_facts_accumulator.append(additional_text_facts_df)
+        logger.info("Additional report successfully appended!")
 
 
     def mismatches(self):
-        return check_for_mismatches(self.facts_df)
\ No newline at end of file
+        return self.facts_accumulator.mismatches()
+
+
+    def compare(self, concepts=None, periods=None, keep="latest"):
+        # Only the concepts and columns the pivot needs are read back when facts have been spilled.
+        facts_df = self.facts_accumulator.select(concepts, COMPARE_COLUMNS) if self.facts_accumulator.spilled else self.facts_df
+        return compare_facts(facts_df, concepts=concepts, periods=periods, keep=keep)
\ No newline at end of file
@@ -0,0 +1,179 @@
+from . import XBRLReport
+import argparse
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import urllib.parse
+
+
+PARTITION_COLUMNS = ["Ticker", "Year", "Quarter"]
+PARTITION_SCHEMA = pa.schema([(column, pa.string()) for column in PARTITION_COLUMNS])
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+ROW_GROUP_SIZE = 8_192
+XBRL_COLUMN_ORDER = ["name", "context", "value", "unit", "decimals", "date", "start", "end", "instant", "dimensions", "Quarter", "Year", "Amended", "Ticker"]
+
+FACT_SCHEMA = pa.schema([
+    ("name", pa.string()),
+    ("context", pa.string()),
+    ("value", pa.float64()),
+    ("unit", pa.string()),
+    ("decimals", pa.float64()),
+    ("date", pa.string()),
+    ("start", pa.timestamp("ns")),
+    ("end", pa.timestamp("ns")),
+    ("instant", pa.timestamp("ns")),
+    ("dimensions", pa.string()),
+    ("Amended", pa.string()),
+])
+TEXT_FACT_SCHEMA = pa.schema([field for field in FACT_SCHEMA if field.name not in ("unit", "decimals")]).set(2, pa.field("value", pa.string()))
+
+
+def partition_directory(root, values):
+    segments = [
+        f"{column}={NULL_PARTITION if value is None or value != value else urllib.parse.quote(str(value), safe='')}"
+        for column, value in zip(PARTITION_COLUMNS, values)
+    ]
+    return os.path.join(root, *segments)
+
+
+class FactStore:
+
+    """
+    Fact Store Class\n
+    Local Parquet copy of XBRL facts, partitioned Ticker=/Year=/Quarter= (hive layout) with numeric and text facts in separate datasets.
+    Within each file rows are sorted by concept name and split into row groups, so a query for a handful of concepts only reads the
+    partitions and row groups that can contain them and only the requested columns.
+    Writing the same filing again replaces its file instead of duplicating it.
+
+    Use:\n
+    store = FactStore("facts")
+    store.write(report.facts_df, report.text_facts_df)
+    store.query(concepts=["Assets"], tickers=["SQ"], years=["2021"])
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.facts_root = os.path.join(root, "facts")
+        self.text_facts_root = os.path.join(root, "text_facts")
+
+
+    def write(self, facts_df, text_facts_df=None):
+        """
+        Purpose: Write facts to the store, one file per filing (Ticker, Year, Quarter and amendment flag).
+        Inputs: numeric facts dataframe and optionally the text facts dataframe, as produced by XBRLReport.
+        Output: list of files written.
+        """
+        written = self._write_dataset(facts_df, self.facts_root, FACT_SCHEMA)
+        if text_facts_df is not None:
+            written += self._write_dataset(text_facts_df, self.text_facts_root, TEXT_FACT_SCHEMA)
+        return written
+
+
+    def _write_dataset(self, facts_df, root, schema):
+        written = list()
+        if facts_df.empty:
+            return written
+        for partition_values, partition_df in facts_df.groupby(PARTITION_COLUMNS + ["Amended"], observed=True, dropna=False, sort=False):
+            directory = partition_directory(root, partition_values[:3])
+            os.makedirs(directory, exist_ok=True)
+            amended = partition_values[3]
+            file_name = "amended.parquet" if str(amended).lower() == "true" else "original.parquet"
+
+            partition_df = partition_df.sort_values("name")[schema.names]
+            partition_df = partition_df.astype({column: object for column in partition_df.select_dtypes("category").columns})
+            table = pa.Table.from_pandas(partition_df, schema=schema, preserve_index=False)
+
+            # Write next to the destination and rename, so a concurrent reader never sees a half written file.
+            temporary_path = os.path.join(directory, f".{file_name}.{os.getpid()}.tmp")
+            pq.write_table(table, temporary_path, row_group_size=ROW_GROUP_SIZE)
+            os.replace(temporary_path, os.path.join(directory, file_name))
+            written.append(os.path.join(directory, file_name))
+        return written
+
+
+    def dataset(self, text=False):
+        root = self.text_facts_root if text else self.facts_root
+        schema = TEXT_FACT_SCHEMA if text else FACT_SCHEMA
+        if not os.path.isdir(root):
+            return None
+        return ds.dataset(
+            root,
+            format="parquet",
+            schema=pa.unify_schemas([schema, PARTITION_SCHEMA]),
+            partitioning=ds.partitioning(PARTITION_SCHEMA, flavor="hive"),
+            exclude_invalid_files=True,
+        )
+
+
+    def query(self, concepts=None, tickers=None, years=None, quarters=None, dates=None, period_start=None, period_end=None, columns=None, text=False):
+        """
+        Purpose: Load the facts matching every given filter. Ticker / Year / Quarter filters prune whole partitions, concept filters skip
+        row groups using the Parquet statistics, and only the requested columns are read.
+        Inputs: lists of concepts (e.g. "Assets"), tickers, fiscal years ("2021"), fiscal quarters ("Q2", "FY") and date labels,
+        optional period_start / period_end bounds on each fact's end (or instant) date, the columns to return and whether to read text facts.
+        Output: typed facts dataframe in the XBRLReport layout.
+        """
+        dataset = self.dataset(text=text)
+        if dataset is None:
+            return pd.DataFrame(columns=columns)
+
+        filters = list()
+        for column, values in (("name", concepts), ("Ticker", tickers), ("Year", years), ("Quarter", quarters), ("date", dates)):
+            if values is not None:
+                filters.append(ds.field(column).isin([str(value) for value in values]))
+        period_date = pc.coalesce(ds.field("end"), ds.field("instant"))
+        if period_start is not None:
+            filters.append(period_date >= pa.scalar(pd.Timestamp(period_start).value, pa.timestamp("ns")))
+        if period_end is not None:
+            filters.append(period_date <= pa.scalar(pd.Timestamp(period_end).value, pa.timestamp("ns")))
+
+        expression = None
+        for condition in filters:
+            expression = condition if expression is None else expression & condition
+
+        if columns is None:
+            columns = [column for column in XBRL_COLUMN_ORDER if column in dataset.schema.names]
+        facts_df = dataset.to_table(columns=columns, filter=expression).to_pandas()
+        return XBRLReport.categorize_fact_columns(facts_df)
+
+
+def ingest(filing_urls, root, session=None, max_workers=10, parse_workers=None):
+    """
+    Purpose: Download, parse and store the facts of many filings.
+    Inputs: Edgar Filing URLs, the store root and the batch options of XBRLReport.from_urls.
+    Output: dictionary of filing url to the exception that stopped it.
+    """
+    store = FactStore(root)
+    report, errors = XBRLReport.XBRLReport.from_urls(filing_urls, session=session, max_workers=max_workers, parse_workers=parse_workers)
+    if report.all_links:
+        store.write(report.facts_df, report.text_facts_df)
+    return errors
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(prog="python -m Helpers.XBRL.factstore", description="Ingest XBRL facts into a local Parquet fact store.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = subparsers.add_parser("ingest", help="Fetch, parse and store the facts of Edgar filings.")
+    ingest_parser.add_argument("filing_urls", nargs="*", help="Edgar Filing URLs (iXBRL or HTML).")
+    ingest_parser.add_argument("--urls-file", help="File with one Edgar Filing URL per line.")
+    ingest_parser.add_argument("--root", default="facts", help="Fact store directory (default: ./facts).")
+    ingest_parser.add_argument("--workers", type=int, default=10, help="Concurrent downloads.")
+    arguments = parser.parse_args(arguments)
+
+    filing_urls = list(arguments.filing_urls)
+    if arguments.urls_file:
+        with open(arguments.urls_file) as urls_file:
+            filing_urls += [line.strip() for line in urls_file if line.strip() and not line.startswith("#")]
+
+    errors = ingest(filing_urls, arguments.root, max_workers=arguments.workers)
+    for filing_url, error in errors.items():
+        print(f"Failed: {filing_url} - {error!r}")
+    print(f"Stored {len(filing_urls) - len(errors)} of {len(filing_urls)} filings in {arguments.root}.")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
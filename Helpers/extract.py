@@ -0,0 +1,297 @@
+from .CompanyFiling import Filing
+from .Edgar import submissions
+from .Edgar.concurrency import run_batch
+from .XBRL import XBRLReport, factstore
+from . import instrumentation
+import argparse
+import contextlib
+import functools
+import json
+import logging
+import os
+import time
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+PARTS = ("statements", "facts")
+OUTPUT_FORMATS = ("csv", "parquet")
+JOURNAL_NAME = "journal.jsonl"
+STATS_NAME = "stats.json"
+STATEMENT_TABLES = dict(BS="bs", IS="is_", CF="cf")
+
+
+def resolve_filing_spec(spec, session=None):
+    """
+    Purpose: Turn one input line into a filing url. Lines are either Edgar Filing URLs or CIK:PERIOD[:FORM] specs, e.g. 1512673:2021-06-30
+    or 1512673:20201231:10-K, resolved through the EDGAR submissions api.
+    Inputs: spec, optionally the EdgarSession.
+    Output: filing url.
+    """
+    if spec.startswith("http"):
+        return spec
+    cik, period, *form = spec.split(":")
+    return submissions.find_filing_url(cik, period, forms=tuple(form) or submissions.PERIODIC_FORMS, session=session)
+
+
+def fetch_filing(spec, session=None, page_pool=None, parts=PARTS):
+    filing_url = resolve_filing_spec(spec, session=session)
+    fetched = dict(spec=spec, url=filing_url)
+    if "statements" in parts:
+        fetched["statements"] = Filing.fetch_filing_pages(filing_url, session=session, page_pool=page_pool)
+    if "facts" in parts:
+        fetched["instance"] = XBRLReport.fetch_instance(filing_url, session=session)
+    return fetched
+
+
+def parse_filing(fetched):
+    """
+    Purpose: Parse what fetch_filing downloaded. Runs in a worker process.
+    Inputs: dictionary returned by fetch_filing.
+    Output: dictionary of spec, url and the statements, facts and text_facts dataframes that were requested.
+    """
+    parsed = dict(spec=fetched["spec"], url=fetched["url"])
+    if "statements" in fetched:
+        tables = Filing.parse_filing_pages(fetched["statements"])
+        filing = Filing.Filing(fetched["url"], slugs=tables["slugs"])
+        parsed["statements"] = statements_long_frame(filing, {kind: tables[name] for kind, name in STATEMENT_TABLES.items()})
+    if "instance" in fetched:
+        parsed["facts"], parsed["text_facts"] = XBRLReport.facts_from_instance(fetched["instance"])
+    return parsed
+
+
+def statements_long_frame(filing, tables):
+    long_frames = list()
+    for kind, table in tables.items():
+        numeric_columns = list(table.select_dtypes("number").columns)
+        long_frame = table[numeric_columns].assign(Captions=table["Captions"].to_numpy(), line=range(len(table)))
+        long_frame = long_frame.melt(id_vars=["line", "Captions"], value_vars=numeric_columns, var_name="period", value_name="value")
+        long_frames.append(long_frame.assign(statement=kind))
+    statements_df = pd.concat(long_frames, ignore_index=True)
+    statements_df.insert(0, "url", filing.edgar_filing_url)
+    statements_df.insert(1, "ticker", filing.ticker)
+    statements_df.insert(2, "period_end", filing.period_end)
+    return statements_df[["url", "ticker", "period_end", "statement", "line", "Captions", "period", "value"]]
+
+
+class Journal:
+
+    """
+    Checkpoint Journal Class\n
+    Append-only JSON lines file recording the outcome of every input spec of an extraction run. A spec is journaled as done only after its
+    rows have been written, together with the state of the output after that write (see ResultWriter.write), so rows written by a flush
+    that was interrupted before it was journaled can be rolled back (ResultWriter.rollback). An interrupted run thus resumes from the
+    journal without losing or repeating finished filings.
+
+    Use:\n
+    journal = Journal("out/journal.jsonl")
+    journal.record([dict(spec=spec, url=url, status="done")], outputs=dict(csv_sizes={"facts.csv": 1024}, parts=[]))
+    journal.finished()
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = dict()
+        # Output state after the last journaled write and every statement part journaled; None for journals that do not record them
+        self.csv_sizes, self.parts = dict(), set()
+        if os.path.exists(path):
+            with open(path) as journal_file:
+                for line in journal_file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A line cut short by a crash
+                        continue
+                    self.entries[entry["spec"]] = entry
+                    self.add_outputs(entry)
+            if any(entry["status"] == "done" and "outputs" not in entry for entry in self.entries.values()):
+                self.csv_sizes = self.parts = None
+
+
+    def finished(self, retry_errors=False):
+        return {spec for spec, entry in self.entries.items() if entry["status"] == "done" or not retry_errors}
+
+
+    def errors(self):
+        return {spec: entry["error"] for spec, entry in self.entries.items() if entry["status"] == "error"}
+
+
+    def add_outputs(self, entry):
+        if "outputs" in entry and self.parts is not None:
+            self.csv_sizes.update(entry["outputs"]["csv_sizes"])
+            self.parts.update(entry["outputs"]["parts"])
+
+
+    def record(self, entries, outputs=None):
+        if not entries:
+            return
+        with open(self.path, "a") as journal_file:
+            for entry in entries:
+                entry = dict(entry, outputs=outputs) if outputs is not None else entry
+                journal_file.write(json.dumps(dict(entry, time=time.time())) + "\n")
+                self.entries[entry["spec"]] = entry
+                self.add_outputs(entry)
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+
+
+class ResultWriter:
+
+    """
+    Result Writer Class\n
+    Writes extraction results as they arrive. CSV output appends to statements.csv, facts.csv and text_facts.csv; Parquet output writes
+    statement part files under statements/ and facts to a FactStore under facts/ (see Helpers.XBRL.factstore). Fact store files are
+    replaced when a filing is written again, the CSV files and statement parts are rolled back to the journal before a run resumes.
+    """
+
+    def __init__(self, directory, output_format="csv"):
+        self.directory = directory
+        self.output_format = output_format
+        self.parts_written = 0
+        self.fact_store = factstore.FactStore(directory) if output_format == "parquet" else None
+
+
+    def write(self, results):
+        """
+        Purpose: Write the results of one flush.
+        Inputs: list of parse_filing results.
+        Output: the outputs to journal with them: dictionary of csv_sizes (CSV file name to its size after the write) and parts (statement
+        part files written).
+        """
+        frames = {name: [result[name] for result in results if name in result] for name in ("statements", "facts", "text_facts")}
+        outputs = dict(csv_sizes=dict(), parts=list())
+        if self.output_format == "csv":
+            for name, name_frames in frames.items():
+                if name_frames:
+                    path = os.path.join(self.directory, name + ".csv")
+                    self._append_csv(pd.concat(name_frames, ignore_index=True), path)
+                    outputs["csv_sizes"][name + ".csv"] = os.path.getsize(path)
+            return outputs
+
+        if frames["statements"]:
+            statements_directory = os.path.join(self.directory, "statements")
+            os.makedirs(statements_directory, exist_ok=True)
+            part_name = f"part-{int(time.time() * 1000)}-{os.getpid()}-{self.parts_written}.parquet"
+            pd.concat(frames["statements"], ignore_index=True).to_parquet(os.path.join(statements_directory, part_name), index=False)
+            outputs["parts"].append(part_name)
+            self.parts_written += 1
+        for facts_df, text_facts_df in zip(frames["facts"], frames["text_facts"]):
+            self.fact_store.write(facts_df, text_facts_df)
+        return outputs
+
+
+    def rollback(self, journal):
+        """
+        Purpose: Remove output written after the last journaled flush, i.e. by a run interrupted between writing rows and journaling them,
+        so that resuming does not write those filings twice. Journals from before outputs were recorded are left alone.
+        Inputs: Journal of the output directory.
+        Output: None.
+        """
+        if journal.parts is None:
+            return
+        for name in ("statements.csv", "facts.csv", "text_facts.csv"):
+            path = os.path.join(self.directory, name)
+            if os.path.exists(path) and os.path.getsize(path) > journal.csv_sizes.get(name, 0):
+                logger.warning("Removing rows of %s written after the last checkpoint", path)
+                with open(path, "r+b") as csv_file:
+                    csv_file.truncate(journal.csv_sizes.get(name, 0))
+        statements_directory = os.path.join(self.directory, "statements")
+        if os.path.isdir(statements_directory):
+            for part_name in os.listdir(statements_directory):
+                if part_name.endswith(".parquet") and part_name not in journal.parts:
+                    logger.warning("Removing %s, written after the last checkpoint", part_name)
+                    os.remove(os.path.join(statements_directory, part_name))
+
+
+    def _append_csv(self, frame, path):
+        write_header = not os.path.exists(path) or os.path.getsize(path) == 0
+        frame.to_csv(path, mode="a", header=write_header, index=False)
+
+
+def extract(specs, output_directory, output_format="csv", parts=PARTS, session=None, max_workers=10, parse_workers=None, flush_every=50, retry_errors=False):
+    """
+    Purpose: Extract statements and / or XBRL facts for many filings into output_directory, resuming from its journal. Filings are fetched on a
+    thread pool and parsed on a process pool; results are written every flush_every filings (and on interruption), and a failing filing is
+    journaled with its error instead of stopping the run.
+    Inputs: filing urls or CIK:PERIOD[:FORM] specs, the output directory and format ("csv" or "parquet"), the parts to extract, optionally
+    the EdgarSession, fetch threads and parse processes, the flush interval and whether to retry specs that failed in an earlier run.
+    Output: dictionary with the number of filings done, failed and skipped (already in the journal).
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    journal = Journal(os.path.join(output_directory, JOURNAL_NAME))
+    writer = ResultWriter(output_directory, output_format)
+    writer.rollback(journal)
+    specs = list(dict.fromkeys(spec.strip() for spec in specs if spec.strip()))
+    finished = journal.finished(retry_errors)
+    pending_specs = [spec for spec in specs if spec not in finished]
+    summary = dict(done=0, failed=0, skipped=len(specs) - len(pending_specs))
+
+    fetch = functools.partial(fetch_filing, parts=tuple(parts))
+    buffered = list()
+
+    def flush():
+        # The buffer is emptied first: results of a write that raises are neither journaled nor written again by the final flush.
+        results = list(buffered)
+        buffered.clear()
+        if results:
+            outputs = writer.write(results)
+            journal.record([dict(spec=result["spec"], url=result["url"], status="done") for result in results], outputs=outputs)
+            summary["done"] += len(results)
+
+    try:
+        for batch_result in run_batch(pending_specs, fetch, parse_filing, session, max_workers, parse_workers):
+            if batch_result.error is not None:
+                journal.record([dict(spec=batch_result.url, status="error", error=repr(batch_result.error))])
+                summary["failed"] += 1
+                instrumentation.count("failed_filings")
+                logger.warning("Failed: %s - %r", batch_result.url, batch_result.error)
+                continue
+            buffered.append(batch_result.result)
+            instrumentation.count("filings")
+            if len(buffered) >= flush_every:
+                flush()
+    finally:
+        flush()
+    return summary
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(prog="python -m Helpers", description="Bulk extraction of Edgar financial statements and XBRL facts.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    extract_parser = subparsers.add_parser("extract", help="Extract statements and XBRL facts for many filings, resumable.")
+    extract_parser.add_argument("specs", nargs="*", help="Edgar Filing URLs or CIK:PERIOD[:FORM] specs (e.g. 1512673:2021-06-30).")
+    extract_parser.add_argument("--input", help="File with one filing URL or CIK:PERIOD[:FORM] spec per line.")
+    extract_parser.add_argument("--output", default="extract", help="Output directory, also holding the checkpoint journal (default: ./extract).")
+    extract_parser.add_argument("--format", choices=OUTPUT_FORMATS, default="csv", help="Output format (default: csv).")
+    extract_parser.add_argument("--parts", default=",".join(PARTS), help="Comma separated parts to extract: statements, facts (default: both).")
+    extract_parser.add_argument("--workers", type=int, default=10, help="Concurrent downloads.")
+    extract_parser.add_argument("--parse-workers", type=int, default=None, help="Parse processes (default: one per CPU, 0 to parse on the download threads).")
+    extract_parser.add_argument("--flush-every", type=int, default=50, help="Filings per write and checkpoint.")
+    extract_parser.add_argument("--retry-errors", action="store_true", help="Retry specs that failed in an earlier run.")
+    extract_parser.add_argument("--stats", action="store_true", help=f"Time every stage and write the timers and counters to {STATS_NAME} in the output directory.")
+    extract_parser.add_argument("--log-level", default="WARNING", help="Logging level, e.g. INFO or DEBUG for one event per stage (default: WARNING).")
+    arguments = parser.parse_args(arguments)
+
+    parts = [part.strip() for part in arguments.parts.split(",") if part.strip()]
+    unknown_parts = set(parts) - set(PARTS)
+    if unknown_parts:
+        parser.error(f"unknown parts: {', '.join(sorted(unknown_parts))}")
+
+    specs = list(arguments.specs)
+    if arguments.input:
+        with open(arguments.input) as input_file:
+            specs += [line.strip() for line in input_file if line.strip() and not line.startswith("#")]
+
+    logging.basicConfig(level=arguments.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    with instrumentation.collecting() if arguments.stats else contextlib.nullcontext() as stats:
+        summary = extract(
+            specs, arguments.output, output_format=arguments.format, parts=parts, max_workers=arguments.workers,
+            parse_workers=arguments.parse_workers, flush_every=arguments.flush_every, retry_errors=arguments.retry_errors,
+        )
+    if stats is not None:
+        with open(os.path.join(arguments.output, STATS_NAME), "w") as stats_file:
+            json.dump(stats.as_dict(), stats_file, indent=2)
+        print(stats)
+    print(f"Done {summary['done']}, failed {summary['failed']}, skipped {summary['skipped']} (already in {os.path.join(arguments.output, JOURNAL_NAME)}).")
+    return 1 if summary["failed"] else 0
@@ -0,0 +1,151 @@
+from collections import defaultdict
+import contextlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_active_stats = None
+
+
+class PipelineStats:
+
+    """
+    Pipeline Stats Class\n
+    Per-stage timers (wall and thread CPU seconds, calls) and counters collected while instrumentation is enabled. Stages can also be recorded per
+    key (usually the filing url) to find the filings that dominate a run. Stats from worker processes or other runs are combined with merge().
+
+    Use:\n
+    with instrumentation.collecting() as stats:
+        Filing.Filing(url).get_balance_sheet()
+    stats.as_dict()["timers"]["clean_dataframe"]
+    """
+
+    def __init__(self):
+        self.timers = defaultdict(lambda: dict(calls=0, seconds=0.0, cpu_seconds=0.0))
+        self.counters = defaultdict(int)
+        self.by_key = defaultdict(lambda: defaultdict(float))
+        self._lock = threading.Lock()
+
+
+    def record(self, stage, seconds, cpu_seconds=0.0, key=None):
+        with self._lock:
+            timer = self.timers[stage]
+            timer["calls"] += 1
+            timer["seconds"] += seconds
+            timer["cpu_seconds"] += cpu_seconds
+            if key is not None:
+                self.by_key[key][stage] += seconds
+
+
+    def add(self, counter, value=1):
+        with self._lock:
+            self.counters[counter] += value
+
+
+    def merge(self, stats):
+        """
+        Purpose: Add the timers and counters of another PipelineStats (or of its as_dict()) to these.
+        Inputs: PipelineStats or dictionary.
+        Output: self.
+        """
+        stats = stats.as_dict() if isinstance(stats, PipelineStats) else stats
+        with self._lock:
+            for stage, timer in stats["timers"].items():
+                for field, value in timer.items():
+                    self.timers[stage][field] += value
+            for counter, value in stats["counters"].items():
+                self.counters[counter] += value
+            for key, stages in stats["by_key"].items():
+                for stage, seconds in stages.items():
+                    self.by_key[key][stage] += seconds
+        return self
+
+
+    def slowest(self, stage=None, count=10):
+        # Keys (filings) with the most time in one stage, or in all stages together.
+        totals = {key: stages.get(stage, 0.0) if stage else sum(stages.values()) for key, stages in self.by_key.items()}
+        return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:count]
+
+
+    def as_dict(self):
+        with self._lock:
+            return dict(
+                timers={stage: dict(timer) for stage, timer in self.timers.items()},
+                counters=dict(self.counters),
+                by_key={key: dict(stages) for key, stages in self.by_key.items()},
+            )
+
+
+    def __repr__(self):
+        timers = ", ".join(f"{stage}={timer['seconds']:.3f}s/{timer['calls']}" for stage, timer in sorted(self.timers.items()))
+        counters = ", ".join(f"{counter}={value:,}" for counter, value in sorted(self.counters.items()))
+        return f"PipelineStats({timers}; {counters})"
+
+
+def enable(stats=None):
+    """
+    Purpose: Start collecting stats in this process. Instrumentation is off by default and costs one global lookup per stage while off.
+    Inputs: optionally the PipelineStats to collect into.
+    Output: the active PipelineStats.
+    """
+    global _active_stats
+    _active_stats = stats if stats is not None else PipelineStats()
+    return _active_stats
+
+
+def disable():
+    global _active_stats
+    stats, _active_stats = _active_stats, None
+    return stats
+
+
+def active_stats():
+    return _active_stats
+
+
+@contextlib.contextmanager
+def collecting(stats=None):
+    previous = _active_stats
+    stats = enable(stats)
+    try:
+        yield stats
+    finally:
+        if previous is not None:
+            enable(previous)
+        else:
+            disable()
+
+
+@contextlib.contextmanager
+def timer(stage, key=None):
+    # Context manager or decorator: adds wall and thread CPU time to stage (and to key) while stats are being collected.
+    stats = _active_stats
+    if stats is None:
+        yield
+        return
+    started, cpu_started = time.perf_counter(), time.thread_time()
+    try:
+        yield
+    finally:
+        seconds, cpu_seconds = time.perf_counter() - started, time.thread_time() - cpu_started
+        stats.record(stage, seconds, cpu_seconds, key)
+        logger.debug("%s took %.4f s", stage, seconds, extra=dict(stage=stage, seconds=seconds, cpu_seconds=cpu_seconds, key=key))
+
+
+def count(counter, value=1):
+    stats = _active_stats
+    if stats is not None:
+        stats.add(counter, value)
+
+
+def call_collecting(function, *arguments):
+    """
+    Purpose: Run function in a worker process with its own stats, so the parent can merge them (see concurrency.run_batch).
+    Inputs: a module level function and its arguments.
+    Output: (function result, stats dictionary).
+    """
+    with collecting() as stats:
+        result = function(*arguments)
+    return result, stats.as_dict()
@@ -0,0 +1,200 @@
+import sys
+sys.path.append('../')
+
+from Helpers.CompanyFiling import Filing, fsmetrics
+from Helpers.Edgar import cache
+from Helpers.XBRL import XBRLReport
+from Tests.fixtures import FixtureSession, synthetic
+import argparse
+import gc
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+DEFAULT_THRESHOLD = 0.5
+
+
+def fresh_filings(corpus):
+    # Drop remembered slugs so every run parses FilingSummary.xml again, as a first visit would.
+    cache.get_json_store("slugs").values.clear()
+    return [Filing.Filing(filing_url, session=corpus["session"]) for filing_url in corpus["urls"]]
+
+
+def loaded_filings(corpus):
+    filings = fresh_filings(corpus)
+    for filing in filings:
+        filing.bs, filing.is_, filing.cf, filing.dei
+    return filings
+
+
+def instances(corpus):
+    return [XBRLReport.fetch_instance(filing_url, session=corpus["session"]) for filing_url in corpus["urls"]]
+
+
+def bench_xbrl_soup(instance_documents):
+    return sum(len(XBRLReport.facts_from_instance(instance_xml, parser="soup")[0]) for instance_xml in instance_documents)
+
+
+def bench_xbrl_stream(instance_documents):
+    return sum(len(XBRLReport.facts_from_instance(instance_xml)[0]) for instance_xml in instance_documents)
+
+
+def bench_clean_tables(filings):
+    for filing in filings:
+        for table_url in (filing.balance_sheet_url, filing.income_statement_url, filing.cash_flow_url):
+            Filing.get_clean_table(table_url, session=filing.session)
+    return len(filings)
+
+
+def bench_mismatches(facts_df):
+    XBRLReport.check_for_mismatches(facts_df)
+    return len(facts_df)
+
+
+def bench_mismatches_incremental(facts_frames):
+    accumulator = XBRLReport.FactAccumulator()
+    for facts_df in facts_frames:
+        accumulator.append(facts_df)
+        accumulator.mismatches()
+    return sum(len(facts_df) for facts_df in facts_frames)
+
+
+def bench_mismatches_recompute(facts_frames):
+    for filings in range(1, len(facts_frames) + 1):
+        XBRLReport.check_for_mismatches(XBRLReport.concat_facts(facts_frames[:filings]))
+    return sum(len(facts_df) for facts_df in facts_frames)
+
+
+def bench_compare(facts_df):
+    return len(XBRLReport.compare_facts(facts_df))
+
+
+def bench_per_share_scalar(filings):
+    for filing in filings:
+        shares_outstanding = fsmetrics.get_shares_outstanding(filing)[1]
+        fsmetrics.book_value_per_share(filing, shares_outstanding)
+        fsmetrics.cash_flow_per_share(filing, shares_outstanding)
+    return len(filings)
+
+
+def bench_per_share_panel(filings):
+    return len(fsmetrics.filings_per_share_metrics(filings))
+
+
+def bench_filing_batch(corpus):
+    cache.get_json_store("slugs").values.clear()
+    return sum(batch_result.error is None for batch_result in Filing.Filing.batch(corpus["urls"], session=corpus["session"], parse_workers=0))
+
+
+def filing_facts(corpus):
+    # Every filing's facts twice, the second copy slightly restated, so the mismatch check has real work to do.
+    facts_frames = [XBRLReport.facts_from_instance(instance_xml)[0] for instance_xml in instances(corpus)]
+    restated_frames = [facts_df.assign(value=facts_df["value"] * 1.001) for facts_df in facts_frames[:1]]
+    return facts_frames + facts_frames + restated_frames
+
+
+def stacked_facts(corpus):
+    return XBRLReport.concat_facts(filing_facts(corpus))
+
+
+# name: (setup(corpus) -> state, benchmark(state) -> units processed, unit)
+BENCHMARKS = dict(
+    xbrl_soup=(instances, bench_xbrl_soup, "facts"),
+    xbrl_stream=(instances, bench_xbrl_stream, "facts"),
+    clean_tables=(fresh_filings, bench_clean_tables, "filings"),
+    mismatches=(stacked_facts, bench_mismatches, "facts"),
+    mismatches_incremental=(filing_facts, bench_mismatches_incremental, "facts"),
+    mismatches_recompute=(filing_facts, bench_mismatches_recompute, "facts"),
+    compare=(stacked_facts, bench_compare, "rows"),
+    per_share_scalar=(loaded_filings, bench_per_share_scalar, "filings"),
+    per_share_panel=(loaded_filings, bench_per_share_panel, "filings"),
+    filing_batch=(lambda corpus: corpus, bench_filing_batch, "filings"),
+)
+
+
+def measure(setup, benchmark, corpus, repeat):
+    best_seconds, units = float("inf"), 0
+    for _ in range(repeat):
+        state = setup(corpus)
+        gc.collect()
+        started = time.perf_counter()
+        units = benchmark(state)
+        best_seconds = min(best_seconds, time.perf_counter() - started)
+
+    state = setup(corpus)
+    gc.collect()
+    tracemalloc.start()
+    benchmark(state)
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return dict(seconds=best_seconds, units=units, throughput=units / best_seconds if best_seconds else float("inf"), peak_mb=peak_bytes / 1024 ** 2)
+
+
+def run_benchmarks(sizes=tuple(synthetic.SIZES), benchmarks=tuple(BENCHMARKS), filings=None, repeat=3):
+    """
+    Purpose: Time the parsing and metric stages over synthetic corpora served from disk, without any network access.
+    Inputs: corpus sizes (keys of synthetic.SIZES), benchmark names (keys of BENCHMARKS), optionally the filings per corpus and the repeats.
+    Output: dictionary of "size/benchmark" to seconds (best of the repeats), units, throughput (units per second), unit and peak_mb.
+    """
+    results = dict()
+    previous_cache = cache.get_default_cache()
+    cache.set_default_cache(None)
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for size in sizes:
+                corpus = dict(urls=synthetic.write_corpus(os.path.join(directory, size), size, filings), session=FixtureSession(os.path.join(directory, size)))
+                for name in benchmarks:
+                    setup, benchmark, unit = BENCHMARKS[name]
+                    results[f"{size}/{name}"] = dict(measure(setup, benchmark, corpus, repeat), unit=unit)
+    finally:
+        cache.set_default_cache(previous_cache)
+    return results
+
+
+def regressions(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Purpose: Compare benchmark results with a saved baseline.
+    Inputs: run_benchmarks results, baseline results (same format) and the allowed slowdown (0.5 = 50% slower).
+    Output: dictionary of benchmark to (baseline seconds, seconds) for every benchmark slower than allowed.
+    """
+    return {
+        name: (baseline[name]["seconds"], result["seconds"])
+        for name, result in results.items()
+        if name in baseline and result["seconds"] > baseline[name]["seconds"] * (1 + threshold)
+    }
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(prog="python -m Tests.benchmark", description="Offline performance benchmarks on synthetic EDGAR filings.")
+    parser.add_argument("--sizes", default=",".join(synthetic.SIZES), help="Comma separated corpus sizes (default: small,median,large).")
+    parser.add_argument("--benchmarks", default=",".join(BENCHMARKS), help="Comma separated benchmarks (default: all).")
+    parser.add_argument("--filings", type=int, default=None, help="Filings per corpus (default depends on the size).")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per benchmark; the best one is reported.")
+    parser.add_argument("--baseline", help="Baseline json to compare with (and to write with --save-baseline).")
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results to --baseline instead of comparing.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Allowed slowdown before failing (default: 0.5 = 50%%).")
+    arguments = parser.parse_args(arguments)
+
+    results = run_benchmarks(
+        sizes=arguments.sizes.split(","), benchmarks=arguments.benchmarks.split(","), filings=arguments.filings, repeat=arguments.repeat
+    )
+    for name, result in results.items():
+        print(f"{name:<28} {result['seconds']:>9.4f} s  {result['throughput']:>14,.1f} {result['unit']}/s  {result['peak_mb']:>8.1f} MB peak")
+
+    if arguments.baseline and arguments.save_baseline:
+        with open(arguments.baseline, "w") as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+        return 0
+    if arguments.baseline:
+        with open(arguments.baseline) as baseline_file:
+            slower = regressions(results, json.load(baseline_file), arguments.threshold)
+        for name, (baseline_seconds, seconds) in slower.items():
+            print(f"Regression: {name} took {seconds:.4f} s against {baseline_seconds:.4f} s in the baseline")
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
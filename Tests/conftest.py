@@ -0,0 +1,19 @@
+import sys
+sys.path.append('../')
+
+from Helpers.CompanyFiling import captions
+from Helpers.Edgar import cache, client
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path):
+    # Every test gets its own response cache, json stores (slugs, captions) and default session, so nothing is read from or written
+    # to the user's cache directory and no test depends on what an earlier one left behind.
+    previous_cache = cache.set_default_cache(cache.ResponseCache(str(tmp_path / "edgar-cache")))
+    previous_classifier = captions.set_default_classifier(None)
+    previous_session = client.set_default_session(None)
+    yield
+    cache.set_default_cache(previous_cache)
+    captions.set_default_classifier(previous_classifier)
+    client.set_default_session(previous_session)
@@ -0,0 +1,41 @@
+# Recorded EDGAR documents used by the offline tests
+import os
+import requests
+
+FIXTURE_DIRECTORY = os.path.join(os.path.dirname(__file__), "edgar")
+ARCHIVE_PREFIX = "https://www.sec.gov/Archives/edgar/data/"
+SUBMISSIONS_PREFIX = "https://data.sec.gov/submissions/"
+
+filing_url = "https://www.sec.gov/ix?doc=/Archives/edgar/data/1234567/000123456721000001/abc-20210630.htm"
+prior_filing_url = "https://www.sec.gov/ix?doc=/Archives/edgar/data/1234567/000123456721000000/abc-20210331.htm"
+
+
+class FixtureSession:
+
+    """
+    Stand-in for Helpers.Edgar.client.EdgarSession that serves documents from Tests/fixtures/edgar/<cik>/<accession>/ (and submissions
+    json from Tests/fixtures/edgar/submissions/) instead of sec.gov.
+    Unknown urls return a 404 response, just like EDGAR.
+    """
+
+    def __init__(self, directory=FIXTURE_DIRECTORY):
+        self.directory = directory
+        self.requested = []
+
+    def get(self, url):
+        self.requested.append(url)
+        response = requests.Response()
+        response.url = url
+        response.encoding = "utf-8"
+        if url.startswith(SUBMISSIONS_PREFIX):
+            path = os.path.join(self.directory, "submissions", url.replace(SUBMISSIONS_PREFIX, ""))
+        else:
+            path = os.path.join(self.directory, *url.replace(ARCHIVE_PREFIX, "").split("/"))
+        if url.startswith((ARCHIVE_PREFIX, SUBMISSIONS_PREFIX)) and os.path.isfile(path):
+            with open(path, "rb") as fixture_file:
+                response._content = fixture_file.read()
+            response.status_code = 200
+        else:
+            response._content = b""
+            response.status_code = 404
+        return response
@@ -0,0 +1,86 @@
+# Synthetic EDGAR filings of different sizes, built by scaling up the recorded fixture filing
+import os
+import re
+
+from . import ARCHIVE_PREFIX, FIXTURE_DIRECTORY
+
+TEMPLATE_DIRECTORY = os.path.join(FIXTURE_DIRECTORY, "1234567", "000123456721000001")
+TEMPLATE_PREFIX = "abc-20210630"
+
+# Extra line items per statement and extra XBRL facts per filing; small / median / large roughly follow small caps, a typical
+# 10-Q and the largest bank and conglomerate filers.
+SIZES = dict(
+    small=dict(line_items=10, facts=300, filings=20),
+    median=dict(line_items=60, facts=3_000, filings=5),
+    large=dict(line_items=250, facts=25_000, filings=2),
+)
+
+ROW_TEMPLATE = (
+    '<tr class="ro">\n<td class="pl " style="border-bottom: 0px;" valign="top">'
+    '<a class="a" href="javascript:void(0);">Other line item {line}</a></td>\n{cells}</tr>\n'
+)
+CONTEXT_TEMPLATE = (
+    '  <xbrli:context id="c{number}">\n    <xbrli:entity>\n'
+    '      <xbrli:identifier scheme="http://www.sec.gov/CIK">{cik:010d}</xbrli:identifier>\n'
+    '      <xbrli:segment><xbrldi:explicitMember dimension="srt:SegmentsAxis">abc:Segment{number}Member</xbrldi:explicitMember></xbrli:segment>\n'
+    '    </xbrli:entity>\n    <xbrli:period><xbrli:instant>2021-06-30</xbrli:instant></xbrli:period>\n  </xbrli:context>\n'
+)
+FACT_TEMPLATE = '  <abc:SyntheticItem{concept} contextRef="c{context}" unitRef="usd" decimals="-3">{value}000</abc:SyntheticItem{concept}>\n'
+
+
+def read_template(file_name):
+    with open(os.path.join(TEMPLATE_DIRECTORY, file_name), encoding="utf-8") as template_file:
+        return template_file.read()
+
+
+def scale_report(report_html, line_items, seed):
+    # Insert extra rows ahead of the statement's closing rows so totals and key captions stay where the parsers expect them.
+    value_columns = len(re.findall(r'<th class="th"><div>', report_html)) or report_html.count('<th class="th">')
+    rows = "".join(
+        ROW_TEMPLATE.format(line=line, cells="".join(f'<td class="nump">{(seed * 7919 + line * 104729 + column) % 900_000 + 1:,}<span></span></td>\n' for column in range(value_columns)))
+        for line in range(line_items)
+    )
+    insert_at = report_html.index('<tr class="ro">')
+    return report_html[:insert_at] + rows + report_html[insert_at:]
+
+
+def scale_instance(instance_xml, facts, cik, ticker):
+    contexts = max(1, facts // 25)
+    context_xml = "".join(CONTEXT_TEMPLATE.format(number=number, cik=cik) for number in range(contexts))
+    fact_xml = "".join(FACT_TEMPLATE.format(concept=fact // contexts, context=fact % contexts, value=(fact * 7919) % 1_000_000) for fact in range(facts))
+    instance_xml = instance_xml.replace(TEMPLATE_PREFIX + ".xsd", ticker + "-20210630.xsd")
+    insert_at = instance_xml.index("  <xbrli:unit ")
+    instance_xml = instance_xml[:insert_at] + context_xml + instance_xml[insert_at:]
+    return instance_xml.replace("</xbrli:xbrl>", fact_xml + "</xbrli:xbrl>")
+
+
+def write_corpus(directory, size, filings=None):
+    """
+    Purpose: Write synthetic filings of one size in the fixture layout (<cik>/<accession>/...), to be served by FixtureSession(directory).
+    Inputs: target directory, a key of SIZES and optionally the number of filings (default from SIZES).
+    Output: list of the filing urls.
+    """
+    settings = SIZES[size]
+    filings = settings["filings"] if filings is None else filings
+    report_names = sorted(name for name in os.listdir(TEMPLATE_DIRECTORY) if re.match(r"R\d+\.htm$", name))
+    instance_xml = read_template(TEMPLATE_PREFIX + "_htm.xml")
+
+    filing_urls = list()
+    for number in range(filings):
+        cik = 9_000_000 + list(SIZES).index(size) * 10_000 + number
+        ticker = f"{size[0]}{number:04d}"
+        accession = f"{cik:010d}21{number:06d}"
+        filing_directory = os.path.join(directory, str(cik), accession)
+        os.makedirs(filing_directory, exist_ok=True)
+
+        files = {"FilingSummary.xml": read_template("FilingSummary.xml").replace(TEMPLATE_PREFIX, ticker + "-20210630")}
+        for report_name in report_names:
+            report_html = read_template(report_name)
+            files[report_name] = report_html if report_name == "R1.htm" else scale_report(report_html, settings["line_items"], number)
+        files[ticker + "-20210630_htm.xml"] = scale_instance(instance_xml, settings["facts"], cik, ticker)
+        for file_name, content in files.items():
+            with open(os.path.join(filing_directory, file_name), "w", encoding="utf-8") as filing_file:
+                filing_file.write(content)
+
+        filing_urls.append(f"{ARCHIVE_PREFIX.replace('https://www.sec.gov/', 'https://www.sec.gov/ix?doc=/')}{cik}/{accession}/{ticker}-20210630.htm")
+    return filing_urls
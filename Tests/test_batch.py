@@ -0,0 +1,61 @@
+import sys
+sys.path.append('../')
+
+from Helpers import instrumentation
+from Helpers.CompanyFiling import Filing
+from Helpers.Edgar.concurrency import run_batch
+from Helpers.XBRL import XBRLReport
+from Tests.fixtures import FixtureSession, filing_url
+import time
+
+missing_filing_url = filing_url.replace("000123456721000001", "000123456721999999")
+
+
+def test_filing_batch_reports_errors_per_filing():
+    session = FixtureSession()
+    results = {batch_result.url: batch_result for batch_result in Filing.Filing.batch([filing_url, missing_filing_url], session=session, parse_workers=1)}
+    assert results[missing_filing_url].error is not None and results[missing_filing_url].result is None
+    filing = results[filing_url].result
+    assert results[filing_url].error is None and filing.slugs == dict(BS="R2.htm", IS="R4.htm", CF="R6.htm")
+
+    requests_made = len(session.requested)
+    bs, _ = filing.get_balance_sheet()
+    assert filing.get_oustanding_shares()[1] == 452_000_000
+    assert len(session.requested) == requests_made, "Batch loaded filings should not fetch their statements again"
+    assert bs.set_index("Captions").loc["Total assets"].iloc[0] == 5_727_960_000
+
+
+def test_xbrl_report_from_urls():
+    report, errors = XBRLReport.XBRLReport.from_urls([missing_filing_url, filing_url], session=FixtureSession(), parse_workers=0)
+    assert list(errors) == [missing_filing_url]
+    assert report.all_links == [filing_url]
+    assert (len(report.facts_df), len(report.text_facts_df)) == (17, 9)
+
+
+def test_ordered_batch_holds_early_results_within_max_pending():
+    started, started_while_first_ran = list(), list()
+
+    def fetch(url, session=None, page_pool=None):
+        started.append(url)
+        if url == 0:
+            time.sleep(0.3)
+            started_while_first_ran.append(len(started))
+        return url
+
+    results = [batch_result.result for batch_result in run_batch(range(8), fetch, int, max_workers=4, parse_workers=0, max_pending=3, ordered=True)]
+    assert results == list(range(8))
+    assert started_while_first_ran == [3], "Finished results waiting for the first url should stop new fetches"
+
+
+def test_batch_stats_include_worker_processes():
+    with instrumentation.collecting() as stats:
+        results = list(Filing.Filing.batch([filing_url], session=FixtureSession(), parse_workers=1))
+        XBRLReport.XBRLReport.from_urls([filing_url], session=FixtureSession(), parse_workers=1)
+    assert results[0].error is None and instrumentation.active_stats() is None
+
+    timers = stats.as_dict()["timers"]
+    assert timers["fetch_filing"]["calls"] == 1
+    assert timers["parse_filing"]["calls"] == 1, "Stats collected in the parse process should be merged back"
+    assert timers["read_report"]["calls"] == 3 and timers["parse_instance"]["calls"] == 1
+    assert stats.counters["facts"] == 17 and stats.counters["table_rows"] > 0
+    assert [key for key, _ in stats.slowest("parse_filing")] == [filing_url]
@@ -0,0 +1,15 @@
+import sys
+sys.path.append('../')
+
+from Tests import benchmark
+
+
+def test_benchmarks_run_offline_and_flag_regressions():
+    results = benchmark.run_benchmarks(sizes=["small"], filings=2, repeat=1)
+    assert set(results) == {f"small/{name}" for name in benchmark.BENCHMARKS}
+    assert results["small/xbrl_stream"]["units"] == results["small/xbrl_soup"]["units"] == 2 * (17 + 300)
+    assert results["small/filing_batch"]["units"] == 2, "Every synthetic filing should load"
+
+    slower_baseline = {name: dict(result, seconds=result["seconds"] / 3) for name, result in results.items()}
+    assert set(benchmark.regressions(results, slower_baseline)) == set(results)
+    assert benchmark.regressions(results, results) == {}
@@ -0,0 +1,51 @@
+import sys
+sys.path.append('../')
+
+from Helpers.Edgar import cache, client
+
+archive_url = "https://www.sec.gov/Archives/edgar/data/1512673/000162828021015094/R2.htm"
+index_url = "https://www.sec.gov/cgi-bin/browse-edgar?action=getcompany&CIK=1512673"
+
+
+def test_cache_round_trip_and_stats(tmp_path):
+    response_cache = cache.ResponseCache(str(tmp_path))
+    assert response_cache.get(archive_url) is None
+    response_cache.put(archive_url, b"<html>balance sheet</html>", encoding="utf-8")
+    response = client.make_edgar_request(archive_url, session=client.EdgarSession(response_cache=response_cache))
+    assert response.status_code == 200 and response.text == "<html>balance sheet</html>"
+    assert (response_cache.stats.hits, response_cache.stats.misses) == (1, 1)
+    assert response_cache.stats.bytes_saved == len(b"<html>balance sheet</html>")
+
+
+def test_index_pages_expire_and_archive_pages_do_not(tmp_path):
+    response_cache = cache.ResponseCache(str(tmp_path), index_ttl=-1)
+    response_cache.put(archive_url, b"immutable")
+    response_cache.put(index_url, b"mutable")
+    assert response_cache.get(archive_url) is not None
+    assert response_cache.get(index_url) is None, "Index pages should expire after index_ttl"
+
+
+def test_lru_eviction_keeps_cache_under_budget(tmp_path):
+    response_cache = cache.ResponseCache(str(tmp_path), max_bytes=25)
+    for number in range(3):
+        response_cache.put(archive_url.replace("R2", f"R{number}"), bytes([number]) * 10)
+    assert response_cache.total_bytes() <= 25
+    assert response_cache.get(archive_url.replace("R2", "R0")) is None, "Least recently used entry should be evicted first"
+    assert response_cache.get(archive_url.replace("R2", "R2")) is not None
+
+
+def test_puts_keep_a_running_total_instead_of_recounting(tmp_path, monkeypatch):
+    response_cache = cache.ResponseCache(str(tmp_path), max_bytes=1_000)
+    recounts = list()
+    total_bytes = response_cache._total_bytes
+    monkeypatch.setattr(response_cache, "_total_bytes", lambda: recounts.append(1) or total_bytes())
+    for number in range(20):
+        response_cache.put(archive_url.replace("R2", f"R{number}"), bytes([number % 5]) * 10)
+    response_cache.put(archive_url.replace("R2", "R0"), b"replaced")
+    response_cache.invalidate(archive_url.replace("R2", "R1"))
+    assert len(recounts) == 1, "Only the first put should count the stored bytes"
+    assert response_cache._stored_bytes == total_bytes() == 5 * 10 + len(b"replaced")
+
+    for number in range(200):
+        response_cache.put(archive_url.replace("R2", f"R{number}"), number.to_bytes(2, "big") * 5)
+    assert total_bytes() <= 1_000 and len(recounts) < 20, "Eviction frees 10% of the budget, so it runs about every 10 puts here"
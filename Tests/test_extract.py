@@ -0,0 +1,60 @@
+import sys
+sys.path.append('../')
+
+from Helpers import extract
+from Helpers.XBRL import factstore
+from Tests.fixtures import FixtureSession, filing_url
+import os
+import pandas as pd
+import pytest
+
+missing_filing_url = filing_url.replace("000123456721000001", "000123456721999999")
+
+
+def test_extract_journals_errors_and_resumes(tmp_path):
+    output_directory = str(tmp_path)
+    specs = [filing_url, "1234567:2021-03-31", missing_filing_url]
+    summary = extract.extract(specs, output_directory, session=FixtureSession(), parse_workers=0, flush_every=1)
+    assert summary == dict(done=1, failed=2, skipped=0), "The Q1 fixture has no R pages and the last filing does not exist"
+
+    statements_df = pd.read_csv(os.path.join(output_directory, "statements.csv"))
+    total_assets = statements_df.query("statement == 'BS' and Captions == 'Total assets'")["value"]
+    assert sorted(total_assets) == [4_012_585_000, 5_727_960_000]
+    assert len(pd.read_csv(os.path.join(output_directory, "facts.csv"))) == 17
+    assert set(extract.Journal(os.path.join(output_directory, extract.JOURNAL_NAME)).errors()) == {"1234567:2021-03-31", missing_filing_url}
+
+    session = FixtureSession()
+    assert extract.extract(specs, output_directory, session=session, parse_workers=0) == dict(done=0, failed=0, skipped=3)
+    assert session.requested == [], "A finished run should not fetch anything again"
+
+    summary = extract.extract(specs, output_directory, parts=["facts"], session=FixtureSession(), parse_workers=0, retry_errors=True)
+    assert summary == dict(done=1, failed=1, skipped=1)
+    assert len(pd.read_csv(os.path.join(output_directory, "facts.csv"))) == 17 + 12
+
+
+def test_extract_rolls_back_rows_written_before_a_crash(tmp_path, monkeypatch):
+    output_directory = str(tmp_path)
+    record = extract.Journal.record
+
+    def crash_after_writing(journal, entries, outputs=None):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(extract.Journal, "record", crash_after_writing)
+    with pytest.raises(KeyboardInterrupt):
+        extract.extract([filing_url], output_directory, session=FixtureSession(), parse_workers=0, flush_every=1)
+    assert len(pd.read_csv(os.path.join(output_directory, "facts.csv"))) == 17, "The rows were written but never journaled"
+
+    monkeypatch.setattr(extract.Journal, "record", record)
+    summary = extract.extract([filing_url], output_directory, session=FixtureSession(), parse_workers=0)
+    assert summary == dict(done=1, failed=0, skipped=0)
+    assert len(pd.read_csv(os.path.join(output_directory, "facts.csv"))) == 17, "Resuming should not repeat the unjournaled rows"
+    statements_df = pd.read_csv(os.path.join(output_directory, "statements.csv"))
+    assert len(statements_df.query("statement == 'BS' and Captions == 'Total assets'")) == 2
+
+
+def test_extract_to_parquet_resolves_cik_period_specs(tmp_path):
+    output_directory = str(tmp_path)
+    summary = extract.extract(["1234567:20210630"], output_directory, output_format="parquet", session=FixtureSession(), parse_workers=0)
+    assert summary == dict(done=1, failed=0, skipped=0)
+    assert set(pd.read_parquet(os.path.join(output_directory, "statements"))["statement"]) == {"BS", "IS", "CF"}
+    assert len(factstore.FactStore(output_directory).query(concepts=["Assets"])) == 2
@@ -0,0 +1,27 @@
+import sys
+sys.path.append('../')
+
+from Helpers.XBRL import XBRLReport, factstore
+from Tests.fixtures import FixtureSession, filing_url, prior_filing_url
+
+
+def test_ingest_and_query_with_filters(tmp_path):
+    store = factstore.FactStore(str(tmp_path))
+    errors = factstore.ingest([filing_url, prior_filing_url], str(tmp_path), session=FixtureSession(), parse_workers=0)
+    assert errors == {}
+
+    assets_df = store.query(concepts=["Assets"], quarters=["Q2"], columns=["name", "date", "value"])
+    assert list(assets_df.columns) == ["name", "date", "value"]
+    assert sorted(assets_df["value"]) == [4_012_585_000, 5_727_960_000]
+
+    recent_df = store.query(concepts=["Assets", "Revenues"], period_start="2021-01-01")
+    assert set(recent_df["Quarter"]) == {"Q1", "Q2"} and (recent_df[["end", "instant"]].max(axis=1) >= "2021-01-01").all()
+    assert list(store.query(text=True, concepts=["DocumentFiscalPeriodFocus"]).sort_values("value")["value"]) == ["Q1", "Q2"]
+
+
+def test_writing_a_filing_twice_replaces_it(tmp_path):
+    store = factstore.FactStore(str(tmp_path))
+    report = XBRLReport.XBRLReport(filing_url, session=FixtureSession())
+    report.to_store(store)
+    report.to_store(store)
+    assert len(XBRLReport.XBRLReport.from_store(store).facts_df) == len(report.facts_df)
@@ -0,0 +1,151 @@
+import sys
+sys.path.append('../')
+
+from Helpers.CompanyFiling import Filing, captions, fsmetrics, rpage
+from Helpers.Edgar import cache
+from Tests.fixtures import FIXTURE_DIRECTORY, FixtureSession, filing_url
+import io
+import numpy as np
+import os
+import pandas as pd
+import pytest
+
+
+def test_clean_dataframe_handles_edgar_cell_formats():
+    table_df = pd.DataFrame(dict(
+        Captions=["Cash", "Net loss", "Other", "Tax rate", "Revenue", "Shares", "Blank", "Margin change", "Rate change"],
+        amounts=["$ 1,234", "$ (56)", "—", "21.5%", "1,000 [1]", "n/a", None, "(5%)", "(12.5)%"],
+    ))
+    cleaned_df, unparsed_cells = Filing.coerce_numeric_frame(table_df)
+    assert cleaned_df["Captions"].equals(table_df["Captions"])
+    np.testing.assert_allclose(cleaned_df["amounts"], [1234, -56, 0, 0.215, 1000, np.nan, 0, -0.05, -0.125])
+    assert unparsed_cells.to_dict("records") == [dict(row=5, column="amounts", value="n/a")]
+
+    recleaned_df, unparsed_cells = Filing.coerce_numeric_frame(cleaned_df)
+    pd.testing.assert_frame_equal(recleaned_df, cleaned_df)
+    assert unparsed_cells.empty, "Cleaning an already clean table should be a no-op"
+
+    scaled_df = Filing.clean_table_from_html(
+        "<table><tr><th>USD ($) $ in Millions</th><th>Jun. 30, 2021</th></tr>"
+        "<tr><td>Revenue</td><td>1,000</td></tr><tr><td>Tax rate</td><td>21.5%</td></tr></table>"
+    )
+    np.testing.assert_allclose(scaled_df["Jun. 30, 2021"], [1_000_000_000, 0.215], err_msg="Percentages should not be scaled")
+
+
+def test_report_table_parser_matches_read_html():
+    filing_directory = os.path.join(FIXTURE_DIRECTORY, "1234567", "000123456721000001")
+    for page in ["R1.htm", "R2.htm", "R4.htm", "R6.htm"]:
+        with open(os.path.join(filing_directory, page), "rb") as page_file:
+            page_html = page_file.read()
+        report_frame, report_table = rpage.read_report_frame(page_html)
+        pd.testing.assert_frame_equal(report_frame, pd.read_html(io.BytesIO(page_html))[0])
+
+    assert report_table.periods == ["6 Months Ended Jun. 30, 2021", "6 Months Ended Jun. 30, 2020"] and report_table.scale == 1_000
+    fallback_frame, fallback_table = rpage.read_report_frame("<table><tr><th>Item</th><th>2021</th></tr><tr><td>Cash</td><td>1,000</td></tr></table>")
+    assert fallback_table is None and fallback_frame["2021"].tolist() == [1000], "Pages without table.report should fall back to read_html"
+
+
+def test_metrics_on_a_filing_fetch_each_page_once():
+    session = FixtureSession()
+    filing = Filing.Filing(filing_url, session=session)
+    shares_outstanding = fsmetrics.get_shares_outstanding(filing)[1]
+    bvps = fsmetrics.book_value_per_share(filing, shares_outstanding)
+    operating_per_share, _ = fsmetrics.cash_flow_per_share(filing, shares_outstanding)
+    operating_dollars, _ = fsmetrics.cash_flow_per_share(filing, shares_outstanding, per_share=False)
+    filing.get_balance_sheet(), filing.get_cash_flow()
+
+    assert sorted(session.requested) == sorted(set(session.requested)), "Each page should be fetched exactly once"
+    np.testing.assert_allclose([shares_outstanding, bvps, operating_per_share], [452_000_000, 6.00315, 1.19808], rtol=1e-5)
+    assert np.isclose(operating_dollars, operating_per_share * shares_outstanding)
+
+    filing.invalidate("CF")
+    fsmetrics.cash_flow_per_share(filing, shares_outstanding)
+    assert session.requested.count(filing.cash_flow_url) == 2 and fsmetrics.book_value_per_share(filing.balance_sheet_url, shares_outstanding, session=session) == bvps
+
+
+def test_panel_metrics_match_scalar_metrics():
+    session = FixtureSession()
+    filings = [Filing.Filing(filing_url, session=session) for _ in range(4)]
+    for ticker, filing in zip(["abc", "zero", "three", "ambiguous"], filings):
+        filing.ticker = ticker
+    cf = filings[0].cf
+    filings[1].cf = cf.assign(**{cf.columns[1]: 0.0})
+    filings[2].cf = cf.assign(**{cf.columns[1]: 0.0, "Extra": cf[cf.columns[2]] * 2})
+    filings[3].cf = pd.concat([cf, cf.iloc[[2]].assign(Captions="Net cash provided by operating activities, restated")], ignore_index=True)
+
+    panel_df = fsmetrics.filings_per_share_metrics(filings)
+    assert list(panel_df.index.names) == ["ticker", "period_end"] and len(panel_df) == 4
+    for filing in filings[:3]:
+        shares_outstanding = filing.get_oustanding_shares()[1]
+        expected = [fsmetrics.book_value_per_share(filing, shares_outstanding), *fsmetrics.cash_flow_per_share(filing, shares_outstanding)]
+        metrics = panel_df.loc[(filing.ticker, filing.period_end)]
+        np.testing.assert_allclose(metrics[["book_value_per_share", "operating_activity_per_share", "overall_cash_flow_per_share"]].astype(float), expected)
+    assert np.isnan(panel_df.loc[("ambiguous", "20210630"), "operating_activity"]), "cash_flow_per_share raises on two operating captions"
+
+
+def test_panel_metrics_have_one_row_per_filing_across_period_ends():
+    filings = [Filing.Filing(filing_url, session=FixtureSession()) for _ in range(2)]
+    filings[1].ticker, filings[1].period_end = "bynd", "20210703"
+    panel_df = fsmetrics.filings_per_share_metrics(filings)
+    assert list(panel_df.index) == [("abc", "20210630"), ("bynd", "20210703")], "Pairs that were never filed should not get rows"
+    assert panel_df.notna().all().all()
+
+
+def test_panel_metrics_without_filings_or_equity():
+    empty_df = fsmetrics.filings_per_share_metrics([])
+    assert empty_df.empty and list(empty_df.index.names) == ["ticker", "period_end"] and "book_value_per_share" in empty_df.columns
+
+    filing = Filing.Filing(filing_url, session=FixtureSession())
+    filing.bs = filing.bs[~filing.bs["Captions"].str.startswith("Total stockholders")]
+    panel_df = fsmetrics.filings_per_share_metrics([filing])
+    assert np.isnan(panel_df["book_value_per_share"].iloc[0]) and panel_df["operating_activity"].notna().all()
+
+    with pytest.raises(ValueError, match="More than one filing"):
+        fsmetrics.filings_per_share_metrics([filing, Filing.Filing(filing_url, session=FixtureSession())])
+
+
+def test_book_value_ignores_other_equity_totals():
+    filing = Filing.Filing(filing_url, session=FixtureSession())
+    shares_outstanding = filing.get_oustanding_shares()[1]
+    bs = filing.bs
+    equity_row = np.flatnonzero(bs["Captions"] == "Total stockholders\u2019 equity")[0]
+    temporary_equity = bs.iloc[[equity_row]].assign(Captions="Total temporary equity", **{column: 1 for column in bs.select_dtypes("number").columns})
+    filing.bs = pd.concat([bs.iloc[:equity_row], temporary_equity, bs.iloc[equity_row:]], ignore_index=True)
+
+    assert np.isclose(fsmetrics.book_value_per_share(filing, shares_outstanding), 6.00315, rtol=1e-5)
+    assert np.isclose(fsmetrics.filings_per_share_metrics([filing])["book_value_per_share"].iloc[0], 6.00315, rtol=1e-5)
+    common_size_bs = filing.get_balance_sheet(commonsize=True)[0]
+    assert np.isclose(common_size_bs.loc[common_size_bs["Captions"] == "Total stockholders\u2019 equity"].iloc[0, 1], 1.0)
+
+
+def test_caption_classifications_persist(tmp_path):
+    store_path = str(tmp_path / "captions.json")
+    classifier = captions.CaptionClassifier(cache.JsonStore(store_path, captions.CLASSIFIER_VERSION))
+    concepts = classifier.classify_many(["Total stockholders\u2019 equity", "Total liabilities and stockholders' equity", None, "Total  Stockholders' Equity [1]", "Total temporary equity", "Stockholders' equity"])
+    assert list(concepts) == ["total_equity", "total_liabilities_and_equity", None, "total_equity", "total_equity_loose", None]
+    assert classifier.classify("Condensed Consolidated Statements of Cash Flows (Parenthetical)", kind="report") == "cash_flow_parenthetical"
+    classifier.store.save()
+
+    reloaded = captions.CaptionClassifier(cache.JsonStore(store_path, captions.CLASSIFIER_VERSION), patterns=dict(line_item=[], report=[]))
+    assert reloaded.classify("total stockholders' equity") == "total_equity", "Stored classifications should be reused without re-matching"
+
+
+def test_lazy_filing_fetches_only_what_is_used():
+    session = FixtureSession()
+    filing = Filing.Filing(filing_url, session=session)
+    assert session.requested == [], "Opening a filing should not fetch anything"
+    assert filing.get_oustanding_shares()[1] == 452_000_000
+    assert [url.split("/")[-1] for url in session.requested] == ["R1.htm"]
+
+    assert filing.slugs == dict(BS="R2.htm", IS="R4.htm", CF="R6.htm")
+    reopened_session = FixtureSession()
+    assert Filing.Filing(filing_url, session=reopened_session).slugs == filing.slugs and reopened_session.requested == [], "Known slugs are persisted"
+
+
+def test_filing_summary_reader_stops_after_the_statements():
+    with open(os.path.join(FIXTURE_DIRECTORY, "1234567", "000123456721000001", "FilingSummary.xml"), "rb") as summary_file:
+        filing_summary_xml = summary_file.read()
+    # A cash flow details report among the notes used to make the cash flow statement ambiguous
+    filing_summary_xml = filing_summary_xml.replace(b"SUPPLEMENTAL CASH FLOW INFORMATION", b"SUPPLEMENTAL CASH FLOWS INFORMATION")
+    assert Filing.face_report_slugs_from_xml(filing_summary_xml) == dict(BS="R2.htm", IS="R4.htm", CF="R6.htm")
+    assert Filing.face_report_slugs_from_xml(filing_summary_xml.decode("utf-8"))["CF"] == "R6.htm"
@@ -0,0 +1,71 @@
+import sys
+sys.path.append('../')
+
+from Helpers.CompanyFiling import history
+from Helpers.Edgar import submissions
+from Tests.fixtures import FIXTURE_DIRECTORY, FixtureSession
+import os
+import pandas as pd
+import shutil
+
+q2_folder = os.path.join("1234567", "000123456721000001")
+q3_folder = os.path.join("1234567", "000123456721000003")
+
+
+def write_q3_filing(directory):
+    # The Q2 filing moved forward a quarter, with a restated December total and a reworded equity caption
+    os.makedirs(os.path.join(directory, q3_folder))
+    for file_name in ["FilingSummary.xml", "R1.htm", "R2.htm", "R4.htm", "R6.htm"]:
+        with open(os.path.join(directory, q2_folder, file_name), encoding="utf-8") as q2_file:
+            content = q2_file.read().replace("Jun. 30, 2021", "Sep. 30, 2021").replace("Jun. 30, 2020", "Sep. 30, 2020").replace("abc-20210630", "abc-20210930")
+        if file_name == "R2.htm":
+            content = content.replace("$ 4,012,585", "$ 4,100,000").replace("Total stockholders&#8217; equity", "Total Stockholders' Equity")
+        with open(os.path.join(directory, q3_folder, file_name), "w", encoding="utf-8") as q3_file:
+            q3_file.write(content)
+
+
+def test_history_updates_incrementally_and_latest_filing_wins(tmp_path):
+    fixture_directory = str(tmp_path / "edgar")
+    shutil.copytree(FIXTURE_DIRECTORY, fixture_directory)
+    write_q3_filing(fixture_directory)
+    index_df = submissions.load_filing_index(os.path.join(fixture_directory, "submissions", "CIK0001234567.json"))
+    q3_index_df = pd.concat([pd.DataFrame(dict(
+        accession=["0001234567-21-000003"], form=["10-Q"], report_date=["2021-09-30"], filing_date=["2021-11-04"],
+        primary_document=["abc-20210930.htm"], url=["https://www.sec.gov/Archives/edgar/data/1234567/000123456721000003/abc-20210930.htm"],
+    )), index_df], ignore_index=True)
+
+    issuer_history = history.IssuerHistory(1234567, filing_index=index_df, session=FixtureSession(fixture_directory), directory=str(tmp_path / "history"))
+    assert list(issuer_history.update(parse_workers=0)) == [index_df["url"][2]], "The Q1 fixture has no R pages"
+    assert list(issuer_history.statement("BS").columns) == ["Captions", "Jun. 30, 2021", "Dec. 31, 2020"]
+
+    session = FixtureSession(fixture_directory)
+    issuer_history = history.IssuerHistory(1234567, filing_index=q3_index_df, session=session, directory=str(tmp_path / "history"))
+    issuer_history.update(parse_workers=0)
+    assert not any("000123456721000001" in url for url in session.requested), "Stored filings should not be fetched again"
+
+    bs = issuer_history.statement("BS").set_index("Captions")
+    assert list(bs.columns) == ["Sep. 30, 2021", "Jun. 30, 2021", "Dec. 31, 2020"]
+    assert bs.loc["Total assets", "Dec. 31, 2020"] == 4_100_000_000, "The restated Q3 value wins over the Q2 one"
+    assert bs.loc["Total Stockholders' Equity"].notna().all() and len(bs) == 12, "Reworded captions stay on one row"
+    cash_flow = issuer_history.statement("CF")
+    assert list(cash_flow.columns[1:]) == ["6 Months Ended Sep. 30, 2021", "6 Months Ended Jun. 30, 2021", "6 Months Ended Sep. 30, 2020", "6 Months Ended Jun. 30, 2020"]
+    assert list(issuer_history.statement("IS", duration="3 Months").columns[1:]) == [
+        "3 Months Ended Sep. 30, 2021", "3 Months Ended Jun. 30, 2021", "3 Months Ended Sep. 30, 2020", "3 Months Ended Jun. 30, 2020"
+    ]
+
+
+def test_blank_captions_do_not_take_another_line_items_key():
+    def rows(url, filing_date, captions, values):
+        return pd.DataFrame(dict(
+            url=url, filing_date=pd.Timestamp(filing_date), statement="BS", line=range(len(captions)), Captions=captions,
+            period="Dec. 31, 2020", duration="", period_end=pd.Timestamp("2020-12-31"), value=values,
+        ))[history.HISTORY_COLUMNS]
+
+    issuer_history = history.IssuerHistory(1234567, filing_index=pd.DataFrame(), directory=None)
+    issuer_history.history_df = pd.concat([
+        rows("q3", "2021-11-04", ["Cash", "Total assets"], [1.0, 3.0]),
+        rows("q2", "2021-08-05", ["Cash", None, "Total assets"], [1.0, 2.0, 3.0]),
+    ], ignore_index=True)
+    bs = issuer_history.statement("BS")
+    assert list(bs["Captions"].fillna("")) == ["Cash", "Total assets", ""], "Total assets should stay on one row"
+    assert list(bs["Dec. 31, 2020"]) == [1.0, 3.0, 2.0]
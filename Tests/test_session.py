@@ -0,0 +1,47 @@
+import sys
+sys.path.append('../')
+
+from Helpers import instrumentation
+from Helpers.Edgar import client
+from requests.adapters import BaseAdapter
+import requests
+import time
+
+
+class ScriptedAdapter(BaseAdapter):
+
+    def __init__(self, status_codes):
+        super().__init__()
+        self.status_codes = list(status_codes)
+        self.calls = 0
+
+    def send(self, request, **kwargs):
+        response = requests.Response()
+        response.status_code = self.status_codes[min(self.calls, len(self.status_codes) - 1)]
+        response._content = b"ok"
+        response.url = request.url
+        response.request = request
+        self.calls += 1
+        return response
+
+    def close(self):
+        pass
+
+
+def test_token_bucket_limits_rate():
+    bucket = client.TokenBucket(rate=50, capacity=1)
+    started = time.monotonic()
+    for _ in range(11):
+        bucket.acquire()
+    assert time.monotonic() - started >= 0.19, "11 tokens at 50/s with no burst should take at least 0.2 seconds"
+
+
+def test_session_retries_throttled_requests():
+    session = client.EdgarSession(rate_limit=None, backoff_factor=0, response_cache=None)
+    adapter = ScriptedAdapter([429, 503, 200])
+    session.session.mount("https://", adapter)
+    with instrumentation.collecting() as stats:
+        response = client.make_edgar_request("https://www.sec.gov/Archives/edgar/data/1/000000000000000001/R2.htm", session=session)
+    assert response.status_code == 200 and adapter.calls == 3
+    assert stats.counters == dict(http_requests=3, http_retries=2, bytes_downloaded=6)
+    assert stats.timers["http_request"]["calls"] == 3
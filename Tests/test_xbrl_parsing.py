@@ -0,0 +1,50 @@
+import sys
+sys.path.append('../')
+
+from Helpers.XBRL import XBRLReport
+from Tests.fixtures import FixtureSession, filing_url
+import pandas as pd
+
+instance_xml = FixtureSession().get(XBRLReport.convert_filing_to_instance_url(filing_url)).content
+
+
+def test_streaming_parser_matches_soup_parser():
+    soup_facts_df, soup_text_facts_df = XBRLReport.facts_from_instance(instance_xml, parser="soup")
+    stream_facts_df, stream_text_facts_df = XBRLReport.facts_from_instance(instance_xml, parser="stream")
+    pd.testing.assert_frame_equal(soup_facts_df, stream_facts_df)
+    pd.testing.assert_frame_equal(soup_text_facts_df, stream_text_facts_df)
+
+
+def test_facts_are_typed():
+    facts_df, text_facts_df = XBRLReport.facts_from_instance(instance_xml)
+    assert facts_df["value"].dtype == "float64" and facts_df["instant"].dtype == "datetime64[ns]"
+    assert all(isinstance(facts_df[column].dtype, pd.CategoricalDtype) for column in ["name", "dimensions", "Ticker"])
+    eps = facts_df.query("name == 'EarningsPerShareBasic' and start == @pd.Timestamp('2020-01-01')").squeeze()
+    assert (eps["value"], eps["unit"], eps["decimals"]) == (-0.27, "iso4217:USD/xbrli:shares", 2)
+    assert "NatureOfOperations" in set(text_facts_df["name"]) and "NatureOfOperations" not in set(facts_df["name"])
+
+
+def test_concat_facts_keeps_categories():
+    facts_df, _ = XBRLReport.facts_from_instance(instance_xml)
+    other_facts_df = facts_df.assign(Ticker=facts_df["Ticker"].cat.rename_categories(["XYZ"]))
+    combined_df = XBRLReport.concat_facts([facts_df, other_facts_df])
+    assert isinstance(combined_df["Ticker"].dtype, pd.CategoricalDtype) and list(combined_df["Ticker"].cat.categories) == ["ABC", "XYZ"]
+
+
+def test_instance_buffers_join_codes_in_any_order():
+    buffers = XBRLReport.InstanceBuffers()
+    buffers.add_fact("DocumentFiscalPeriodFocus", "c1", "Q2")
+    buffers.add_fact("Assets", "c1", "100", unit_ref="usd", decimals="-3")
+    buffers.add_fact("Assets", "c2", "40", unit_ref="usd", decimals="-3")
+    buffers.add_fact("Shares", "c2", "7", unit_ref="undefined")
+    buffers.add_context("c2", instant="2021-06-30", dimensions="srt:SegmentsAxis [abc:RetailMember]")
+    buffers.add_context("c1", instant="2021-06-30")
+    buffers.add_unit("usd", "iso4217:USD")
+    buffers.schema_ref = "abc-20210630.xsd"
+
+    facts_df, text_facts_df = XBRLReport.facts_frames_from_buffers(buffers)
+    assert len(buffers.periods["date"]) == 1, "Both contexts share one period"
+    assert list(facts_df["dimensions"]) == ["", "srt:SegmentsAxis [abc:RetailMember]", "srt:SegmentsAxis [abc:RetailMember]"]
+    assert list(facts_df["unit"]) == ["iso4217:USD", "iso4217:USD", "undefined"] and list(facts_df["date"].unique()) == ["06/30/2021"]
+    assert set(facts_df["Quarter"]) == {"Q2"} and facts_df["Year"].isna().all()
+    assert list(text_facts_df["name"]) == ["DocumentFiscalPeriodFocus"] and list(text_facts_df["Ticker"]) == ["ABC"]
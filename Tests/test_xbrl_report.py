@@ -0,0 +1,91 @@
+import sys
+sys.path.append('../')
+
+from Helpers.XBRL import XBRLReport
+from Tests.fixtures import FixtureSession, filing_url, prior_filing_url
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def test_restated_fact_is_a_mismatch():
+    report = XBRLReport.XBRLReport(filing_url, session=FixtureSession())
+    report.append_report(prior_filing_url)
+    mismatch_df = report.mismatches()
+    assert set(mismatch_df["name"]) == {"StockholdersEquity"} and sorted(mismatch_df["value"]) == [2_681_000_000, 2_681_569_000]
+
+
+def test_incremental_mismatches_match_full_recomputation():
+    random = np.random.default_rng(7)
+    accumulator = XBRLReport.FactAccumulator()
+    chunks = list()
+    for _ in range(6):
+        chunk = XBRLReport.categorize_fact_columns(pd.DataFrame(dict(
+            name=random.choice(["Assets", "Revenues", "Cash"], 40),
+            dimensions=random.choice(["", "srt:SegmentsAxis [abc:RetailMember]"], 40),
+            date=random.choice(["12/31/2020", "06/30/2021"], 40),
+            value=random.choice([1.0, 2.0, 3.0, np.nan], 40),
+        )))
+        chunks.append(chunk)
+        accumulator.append(chunk)
+        expected_df = XBRLReport.check_for_mismatches(XBRLReport.concat_facts(chunks))
+        pd.testing.assert_frame_equal(accumulator.mismatches(), expected_df)
+
+
+def test_compare_pivots_peers_and_keeps_latest_filing():
+    report = XBRLReport.XBRLReport(filing_url, session=FixtureSession())
+    report.append_report(prior_filing_url)
+    peer_df = report.facts_df.assign(Ticker="XYZ", value=report.facts_df["value"] * 2)
+    report.facts_df = XBRLReport.concat_facts([report.facts_df, peer_df])
+
+    compare_df = report.compare(concepts=["StockholdersEquity", "Assets"])
+    assert list(compare_df.columns) == ["ABC", "XYZ"] and len(compare_df) == 6
+    restated = compare_df.loc[("StockholdersEquity", "", "12/31/2020")]
+    assert list(restated) == [2_681_569_000, 2 * 2_681_569_000], "The Q2 filing restates the Q1 value and is the latest"
+    assert report.compare(concepts=["StockholdersEquity"], keep="earliest").loc[("StockholdersEquity", "", "12/31/2020"), "ABC"] == 2_681_000_000
+
+    period_df = report.compare(periods=[pd.Timestamp("2021-06-30")])
+    assert set(period_df.index.get_level_values("date")) == {"06/30/2021", "04/01/2021 to 06/30/2021", "01/01/2021 to 06/30/2021"}
+    assert report.compare(concepts=["NotReported"]).empty
+    with pytest.raises(ValueError, match="keep must be"):
+        report.compare(concepts=["StockholdersEquity"], keep="Latest")
+
+
+def test_compare_drops_facts_without_a_ticker():
+    report = XBRLReport.XBRLReport(filing_url, session=FixtureSession())
+    peer_df = report.facts_df.assign(Ticker="XYZ")
+    unknown_df = report.facts_df.assign(Ticker=None, value=-1.0)
+    compare_df = XBRLReport.compare_facts(XBRLReport.concat_facts([report.facts_df, peer_df, unknown_df]), concepts=["Assets"])
+    assert list(compare_df.columns) == ["ABC", "XYZ"], "Facts without a ticker should not be labelled as another company"
+    assert (compare_df.to_numpy() > 0).all()
+
+
+def test_spilled_facts_match_in_memory_results(tmp_path):
+    random = np.random.default_rng(11)
+    accumulator = XBRLReport.FactAccumulator(memory_budget=2_000, spill_directory=str(tmp_path))
+    chunks = list()
+    for _ in range(6):
+        chunk = XBRLReport.categorize_fact_columns(pd.DataFrame(dict(
+            name=random.choice(["Assets", "Revenues", "Cash", "Debt"], 40),
+            dimensions=random.choice(["", "srt:SegmentsAxis [abc:RetailMember]"], 40),
+            date=random.choice(["12/31/2020", "06/30/2021", "03/31/2021"], 40),
+            value=random.choice([1.0, 2.0, 3.0, 4.0, 5.0, 6.0, np.nan], 40),
+        )))
+        chunks.append(chunk)
+        accumulator.append(chunk)
+    assert len(accumulator.spilled) > 1 and len(accumulator.concept_groups()) > 1
+    expected_df = XBRLReport.check_for_mismatches(XBRLReport.concat_facts(chunks))
+    pd.testing.assert_frame_equal(accumulator.mismatches(), expected_df, check_categorical=False, check_index_type=False)
+    pd.testing.assert_frame_equal(accumulator.frame.reset_index(drop=True), XBRLReport.concat_facts(chunks), check_categorical=False)
+
+
+def test_report_within_memory_budget(tmp_path):
+    filing_urls = [filing_url, prior_filing_url]
+    report, _ = XBRLReport.XBRLReport.from_urls(filing_urls, session=FixtureSession(), parse_workers=0)
+    budget_report, errors = XBRLReport.XBRLReport.from_urls(
+        filing_urls, session=FixtureSession(), max_workers=1, parse_workers=0, memory_budget=1, spill_directory=str(tmp_path)
+    )
+    assert not errors and budget_report.all_links == filing_urls and len(budget_report.facts_accumulator.spilled) == 2
+    assert not hasattr(budget_report, "tag_dictionary")
+    pd.testing.assert_frame_equal(budget_report.mismatches().reset_index(drop=True), report.mismatches().reset_index(drop=True), check_categorical=False)
+    pd.testing.assert_frame_equal(budget_report.compare(concepts=["Assets"]), report.compare(concepts=["Assets"]), check_categorical=False)